@@ -0,0 +1,331 @@
+"""
+Benchmark of loading and querying lineage traces.
+
+Times each loading stage (parse, hash, insert, to_pandas) on a directory of traces
+and on a synthetic trace scaled up from a single trace, times every QueryInterface
+method and records the peak memory. Results are written as json, so runs can be
+compared with --compare.
+
+Run from the repository root, so the default paths of the traces are found:
+
+    python src/Benchmark.py --output benchmark.json
+    python src/Benchmark.py --output new.json --compare benchmark.json
+"""
+import argparse
+import json
+import pathlib
+import platform
+import re
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from TraceLoader import load_trace, is_trace_file
+from LinageTraceDatabase import LineageTraceDatabase
+from LoadStats import LoadStats
+from QueryInterface import QueryInterface
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+record_header = re.compile(r"\(([0-9]+)\) \(([LCID])\) ")
+input_id = re.compile(r" \(([0-9]+)\)")
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process in MB, None if it can not be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def scale_trace(path_to_file, output_path, min_lines):
+    """
+    Write a synthetic trace by repeating a trace until it has at least min_lines lines.
+    The ids of each copy are shifted, so the copies are independent parts of one trace.
+    Every creation of a copy gets the number of the copy as extra parameter, so the
+    copies derive from different data and do not share their value hashes.
+    Only literals, and items computed from literals alone, stay shared.
+
+    Parameters
+    ----------
+    path_to_file : str
+        Trace to scale up. Must not contain dedup patches.
+    output_path : str
+        Path of the synthetic trace.
+    min_lines : int
+        Minimum number of lines of the synthetic trace.
+
+    Returns
+    -------
+    int
+        Number of lines written.
+    """
+    with open(path_to_file, "r", encoding="utf-8") as trace_file:
+        lines = [line.rstrip("\n") + "\n" for line in trace_file if line.strip() != ""]
+    max_id = max(int(record_header.match(line).group(1)) for line in lines)
+
+    num_lines = 0
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        copy = 0
+        while num_lines < min_lines:
+            offset = copy * (max_id + 1)
+
+            def shift(match):
+                return match.group(0).replace(
+                    match.group(1), str(int(match.group(1)) + offset)
+                )
+
+            for line in lines:
+                header = record_header.match(line)
+                content = line[header.end() :]
+                if header.group(2) in "ID":
+                    content = input_id.sub(shift, content)
+                elif header.group(2) == "C" and copy > 0:
+                    content = content.rstrip("\n") + f"°{copy}\n"
+                output_file.write(shift(header) + content)
+            num_lines += len(lines)
+            copy += 1
+    return num_lines
+
+
+def benchmark_stages(trace_files, settings):
+    """
+    Time the loading stages of the given trace files, by loading them with load_trace
+    and LoadStats, which splits the time of each file into parse, hash and insert,
+    and then building all tables with to_pandas.
+
+    Returns
+    -------
+    dict
+        Seconds per stage, number of lines and rows per second.
+    """
+    database = LineageTraceDatabase(**settings)
+    database.stats = LoadStats()
+    for path_to_file in trace_files:
+        load_trace(path_to_file, database)
+    database.to_pandas(lazy=False)
+
+    summary = database.stats.summary()
+    return {
+        "seconds": summary["seconds"],
+        "total_seconds": sum(summary["seconds"].values()),
+        "lines": summary["lines"],
+        "rows_per_second": summary["rows_per_second"],
+        "peak_memory_mb": peak_memory_mb(),
+    }
+
+
+def benchmark_load_trace(trace_files, settings):
+    """
+    Time load_trace and to_pandas end to end, as load_directory does serially.
+    """
+    database = LineageTraceDatabase(**settings)
+    start = time.perf_counter()
+    for path_to_file in trace_files:
+        load_trace(path_to_file, database)
+    database.to_pandas(lazy=False)
+    return database, time.perf_counter() - start
+
+
+def query_calls(database):
+    """
+    Calls of every QueryInterface method with arguments that fit the database.
+    """
+    # the first two traces, or the only trace twice
+    trace_ids = database.trace.index[[0, min(1, len(database.trace) - 1)]].tolist()
+    dates = database.trace.date.loc[trace_ids].tolist()
+    items = database.trace_item.loc[trace_ids[0]]
+    first_hash = items.value_hash.iloc[0]
+    last_hash = items.value_hash.iloc[-1]
+    calls = {
+        "compare_total_operations": lambda q: q.compare_total_operations(),
+        "select_operator": lambda q: q.select_operator(
+            q.get_enriched_trace_item(), group="MatrixIndexing"
+        ),
+        "find_trace_long_operation": lambda q: q.find_trace_long_operation(),
+        "execution_time_percentiles": lambda q: q.execution_time_percentiles(),
+        "compare_instruction_count": lambda q: q.compare_instruction_count(),
+        "list_execution_types": lambda q: q.list_execution_types(),
+        "compare_traces_by_id": lambda q: q.compare_traces_by_id(*trace_ids),
+        "compare_traces_by_date": lambda q: q.compare_traces_by_date(*dates),
+        "compare_traces_matrix": lambda q: q.compare_traces_matrix(),
+        "ancestors": lambda q: q.ancestors(last_hash),
+        "descendants": lambda q: q.descendants(first_hash),
+        "subgraph_between": lambda q: q.subgraph_between(first_hash, last_hash),
+        "critical_path": lambda q: q.critical_path(),
+    }
+    if len(database.dedup) > 0:
+        dedup_hash = database.dedup.index[0]
+        calls["expand_dedup"] = lambda q: q.expand_dedup(dedup_hash)
+    return calls
+
+
+def benchmark_queries(database, repeat=3):
+    """
+    Time every QueryInterface method.
+    'first' is the time of the first call on a new QueryInterface, which includes
+    building its caches, 'best' the fastest of the following calls.
+    """
+    results = {}
+    for name, call in query_calls(database).items():
+        query = QueryInterface(database)
+        start = time.perf_counter()
+        call(query)
+        first = time.perf_counter() - start
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            call(query)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        results[name] = {"first": first, "best": best}
+    return results
+
+
+def run(
+    traces_dir="traces",
+    scale_from="traces/13.lineage",
+    scale_lines=1_000_000,
+    hash_format="hex",
+    hash_backend="sha256",
+    repeat=3,
+):
+    """
+    Run all benchmarks.
+
+    Parameters
+    ----------
+    traces_dir : str, default="traces"
+        Directory of traces to load.
+    scale_from : str, default="traces/13.lineage"
+        Trace that is scaled up to a synthetic trace.
+    scale_lines : int, default=1_000_000
+        Minimum number of lines of the synthetic trace. No synthetic trace if 0.
+    hash_format, hash_backend : str
+        Settings of the loaded databases, see LineageTraceDatabase.
+    repeat : int, default=3
+        Number of repeated calls per query.
+
+    Returns
+    -------
+    dict
+        Results, can be written as json.
+    """
+    settings = {"hash_format": hash_format, "hash_backend": hash_backend}
+    trace_files = sorted(
+        path_to_file
+        for path_to_file in pathlib.Path(traces_dir).rglob("*")
+        if is_trace_file(path_to_file)
+    )
+    results = {
+        "date": pd.Timestamp.now(tz="UTC").isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "settings": settings,
+        "datasets": {},
+    }
+
+    results["datasets"]["traces"] = benchmark_stages(trace_files, settings)
+    database, seconds = benchmark_load_trace(trace_files, settings)
+    results["datasets"]["traces"]["load_trace_seconds"] = seconds
+    results["datasets"]["traces"]["queries"] = benchmark_queries(database, repeat)
+    del database
+
+    if scale_lines > 0:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            synthetic_trace = pathlib.Path(tmp_dir) / "synthetic.lineage"
+            scale_trace(scale_from, synthetic_trace, scale_lines)
+            results["datasets"]["synthetic"] = benchmark_stages(
+                [synthetic_trace], settings
+            )
+            database, seconds = benchmark_load_trace([synthetic_trace], settings)
+            results["datasets"]["synthetic"]["load_trace_seconds"] = seconds
+            results["datasets"]["synthetic"]["queries"] = benchmark_queries(
+                database, repeat
+            )
+
+    results["peak_memory_mb"] = peak_memory_mb()
+    return results
+
+
+def flatten(results, prefix=""):
+    """
+    Flatten nested results to {'datasets.traces.seconds.parse': value, ...}.
+    """
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results, baseline):
+    """
+    Relative change of every number in results against a baseline run.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns 'baseline', 'current' and 'ratio' (current / baseline),
+        indexed by the flattened name of each number.
+    """
+    current = pd.Series(flatten(results), dtype="float64")
+    previous = pd.Series(flatten(baseline), dtype="float64")
+    comparison = pd.DataFrame({"baseline": previous, "current": current}).dropna()
+    comparison["ratio"] = comparison.current / comparison.baseline
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--traces", default="traces", help="directory of traces")
+    parser.add_argument("--scale-from", default="traces/13.lineage")
+    parser.add_argument(
+        "--scale-lines",
+        type=int,
+        default=1_000_000,
+        help="lines of the synthetic trace, 0 to skip it",
+    )
+    parser.add_argument("--hash-format", default="hex", choices=["hex", "int64"])
+    parser.add_argument("--hash-backend", default="sha256")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="json file to write the results to")
+    parser.add_argument("--compare", help="json file of an earlier run")
+    args = parser.parse_args()
+
+    results = run(
+        args.traces,
+        args.scale_from,
+        args.scale_lines,
+        args.hash_format,
+        args.hash_backend,
+        args.repeat,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        with pd.option_context("display.max_rows", None, "display.width", 120):
+            print(compare(results, baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+
+
+def trace_dag(trace_item, lineage):
+    """
+    Dependencies between the rows of trace_item, derived from the lineage table.
+
+    Parameters
+    ----------
+    trace_item : pandas.DataFrame
+        Trace items in trace order, indexed by (trace_id, id).
+    lineage : pandas.DataFrame
+        Lineage table indexed by (value_hash, is_input_for_value_hash).
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        (indptr, inputs) in compressed sparse row format: the input positions of
+        the row at position i are inputs[indptr[i]:indptr[i + 1]].
+        If a value hash occurs multiple times within a trace, its first row is used as input.
+    """
+    items = pd.DataFrame(
+        {
+            "trace_id": trace_item.index.get_level_values("trace_id"),
+            "value_hash": trace_item.value_hash.array,
+            "position": np.arange(len(trace_item)),
+        }
+    )
+    edges = lineage.index.to_frame(index=False)
+    edges.columns = ["input_hash", "value_hash"]
+    first_items = items.drop_duplicates(["trace_id", "value_hash"]).rename(
+        columns={"value_hash": "input_hash", "position": "input_position"}
+    )
+    edges = items.merge(edges, on="value_hash").merge(
+        first_items, on=["trace_id", "input_hash"]
+    )
+    edges = edges[edges.input_position < edges.position].sort_values(
+        "position", kind="stable"
+    )
+
+    indptr = np.zeros(len(trace_item) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(edges.position, minlength=len(trace_item)), out=indptr[1:]
+    )
+    return indptr, edges.input_position.to_numpy()
+
+
+def dag_levels(indptr, inputs):
+    """
+    Level of every item of a dependency graph. Items without inputs are level 0,
+    all others are one level above their highest input.
+
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        The inputs of item i are inputs[indptr[i]:indptr[i + 1]].
+    inputs : numpy.ndarray
+        Positions of the input items.
+
+    Returns
+    -------
+    numpy.ndarray or None
+        Level of every item. None if not all items can be ordered, because of a cycle.
+    """
+    num_items = len(indptr) - 1
+    counts = np.diff(indptr)
+    # edges sorted by input, to find the items that use an input
+    edge_items = np.repeat(np.arange(num_items), counts)
+    users = edge_items[np.argsort(inputs, kind="stable")]
+    users_indptr = np.zeros(num_items + 1, dtype=np.int64)
+    np.cumsum(np.bincount(inputs, minlength=num_items), out=users_indptr[1:])
+
+    level_of = np.full(num_items, -1, dtype=np.int64)
+    remaining = counts.copy()
+    frontier = np.flatnonzero(remaining == 0)
+    level = 0
+    while len(frontier) > 0:
+        level_of[frontier] = level
+        level += 1
+        starts = users_indptr[frontier]
+        num_users = users_indptr[frontier + 1] - starts
+        total = num_users.sum()
+        if total == 0:
+            break
+        # positions of all users of the frontier in users
+        offsets = np.repeat(starts - np.cumsum(num_users) + num_users, num_users)
+        frontier_users = users[offsets + np.arange(total)]
+        np.subtract.at(remaining, frontier_users, 1)
+        frontier_users = np.unique(frontier_users)
+        frontier = frontier_users[remaining[frontier_users] == 0]
+    if (level_of < 0).any():
+        return None
+    return level_of
+
+
+def critical_path(trace_item, lineage):
+    """
+    Longest path through the dependencies of each trace, weighted by execution_time.
+
+    Items are processed level by level, see dag_levels: a forward pass over the
+    levels gives the earliest finish and a backward pass the latest finish
+    of every item, with all edges into the items of a level handled at once.
+
+    Parameters
+    ----------
+    trace_item : pandas.DataFrame
+        Trace items in trace order, indexed by (trace_id, id).
+    lineage : pandas.DataFrame
+        Lineage table indexed by (value_hash, is_input_for_value_hash).
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with the index of trace_item and columns
+        'execution_time',
+        'earliest_finish' (end of the longest path ending at the item),
+        'slack' (time the item could take longer without making its trace slower) and
+        'critical' (True for the items of one longest path per trace).
+    """
+    indptr, inputs = trace_dag(trace_item, lineage)
+    trace_ids = np.asarray(trace_item.index.get_level_values("trace_id"))
+    execution_time = trace_item.execution_time.fillna(pd.Timedelta(0))
+    weight = execution_time.to_numpy().astype("int64")
+    num_items = len(weight)
+
+    # inputs always come earlier in trace order, so there are no cycles
+    level_of = dag_levels(indptr, inputs)
+    counts = np.diff(indptr)
+    edge_items = np.repeat(np.arange(num_items), counts)
+    # edges grouped by the level of the item they lead to
+    order = np.argsort(level_of[edge_items], kind="stable")
+    level_starts = np.flatnonzero(np.diff(level_of[edge_items[order]], prepend=-1))
+    level_edges = np.split(order, level_starts[1:]) if len(order) > 0 else []
+
+    earliest_finish = weight.copy()
+    start_after = np.zeros(num_items, dtype=np.int64)
+    for edges in level_edges:
+        np.maximum.at(start_after, edge_items[edges], earliest_finish[inputs[edges]])
+        items = edge_items[edges]
+        earliest_finish[items] = weight[items] + start_after[items]
+
+    finish = pd.Series(earliest_finish)
+    latest_finish = finish.groupby(trace_ids).transform("max").to_numpy()
+    for edges in reversed(level_edges):
+        items = edge_items[edges]
+        np.minimum.at(latest_finish, inputs[edges], latest_finish[items] - weight[items])
+
+    # the first input with the latest earliest finish of every item, -1 if none
+    best_input = np.full(num_items, -1, dtype=np.int64)
+    if len(inputs) > 0:
+        input_finish = earliest_finish[inputs]
+        has_inputs = counts > 0
+        item_starts = indptr[:-1][has_inputs]
+        is_best = input_finish == np.repeat(
+            np.maximum.reduceat(input_finish, item_starts), counts[has_inputs]
+        )
+        first_best = np.minimum.reduceat(
+            np.where(is_best, np.arange(len(inputs)), len(inputs)), item_starts
+        )
+        best_input[has_inputs] = inputs[first_best]
+
+    critical = np.zeros(num_items, dtype=bool)
+    for item in finish.groupby(trace_ids).idxmax():
+        while item >= 0:
+            critical[item] = True
+            item = best_input[item]
+
+    return pd.DataFrame(
+        {
+            "execution_time": execution_time.to_numpy(),
+            "earliest_finish": pd.to_timedelta(earliest_finish, unit="ns"),
+            "slack": pd.to_timedelta(latest_finish - earliest_finish, unit="ns"),
+            "critical": critical,
+        },
+        index=trace_item.index,
+    )
@@ -1,7 +1,56 @@
-import pandas as pd
 import json
 import hashlib
+import random
+import time
 import numpy as np
+from datetime import timedelta
+
+# hash functions for value and lineage hashes, all return hex digests
+hash_backends = {
+    "sha256": lambda data: hashlib.sha256(data).hexdigest(),
+    "blake2b": lambda data: hashlib.blake2b(data, digest_size=16).hexdigest(),
+}
+
+try:
+    import xxhash
+
+    hash_backends["xxh3"] = xxhash.xxh3_128_hexdigest
+except ImportError:
+    pass
+
+
+class TraceItemLookup:
+    """
+    Value and lineage hash of the items of one trace, used to resolve inputs.
+    Stored in a dict from item id to (value_hash, lineage_hash), so memory grows
+    with the number of items, also if the ids of a trace are sparse.
+    """
+
+    def __init__(self):
+        self.hashes = {}
+
+    def add(self, id, value_hash, lineage_hash):
+        self.hashes[id] = (value_hash, lineage_hash)
+
+    def __contains__(self, id):
+        return id in self.hashes
+
+    def __getitem__(self, id):
+        """
+        (value_hash, lineage_hash) of the item with the given id.
+        """
+        return self.hashes[id]
+
+
+type_map = {
+    "L": "LITERAL",
+    "C": "CREATION",
+    "I": "INSTRUCTION",
+    "D": "DEDUP",
+}
+
+execution_types = ["CP", "CP_FILE", "SPARK", "GPU", "FED"]
+execution_type_weights = [0.9, 0.01, 0.04, 0.05, 0]
 
 
 def insert_parsed_row(lineage_row_data, trace_id, database):
@@ -24,40 +73,56 @@ def insert_parsed_row(lineage_row_data, trace_id, database):
         input_ids = representation["inputs"]
         input_items = [database.trace_item_lookup[input] for input in input_ids]
 
-    value_hash = get_value_hash(lineage_row_data, input_items)
-    lineage_hash = get_lineage_hash(lineage_row_data, input_items)
+    stats = database.stats
+    if stats is not None:
+        start = time.perf_counter()
+    hash_backend = database.metadata["hash_backend"]
+    value_hash = get_value_hash(lineage_row_data, input_items, hash_backend)
+    lineage_hash = get_lineage_hash(lineage_row_data, input_items, hash_backend)
+    if stats is not None:
+        stats.add_time("hash", time.perf_counter() - start)
+
+    item_id = lineage_row_data["id"]
+    database.trace_item_lookup.add(item_id, value_hash, lineage_hash)
+    patch_name = database.current_dedup_patch
+    if patch_name is not None:
+        # template of dedup items, not part of the trace
+        database.patch_item_buffer.append(
+            patch_name, item_id, type_map[item_type], value_hash, lineage_hash
+        )
+    else:
+        database.trace_item_buffer.append(
+            trace_id,
+            item_id,
+            type_map[item_type],
+            value_hash,
+            lineage_hash,
+            None,  # dedup_patch_name
+            None,  # mem_size
+            timedelta(milliseconds=random.randint(10, 999)),
+        )
+        if value_hash in database.trace_value_hashes:
+            return
+        database.trace_value_hashes.add(value_hash)
+        database.trace_value_buffer.append(trace_id, value_hash)
+
+    # the rows of a value hash are only buffered for its first item,
+    # later items, also of other traces, just reference it
+    if value_hash in database.seen_value_hashes:
+        return
+    database.seen_value_hashes.add(value_hash)
 
     if item_type in "ID":
-        lineage_data = [
-            [input_item["value_hash"], value_hash] for input_item in input_items  # type: ignore
-        ]
-        database.lineage_buffer.extend(lineage_data)
-
-    type_map = {
-        "L": "LITERAL",
-        "C": "CREATION",
-        "I": "INSTRUCTION",
-        "D": "DEDUP",
-    }
-
-    trace_item = {
-        "id": lineage_row_data["id"],
-        "trace_id": trace_id,
-        "type": type_map[lineage_row_data["type"]],
-        "value_hash": value_hash,
-        "lineage_hash": lineage_hash,
-        "dedup_patch_name": database.current_dedup_patch,
-        "mem_size": pd.NA,
-        "execution_time": pd.Timedelta(np.random.randint(10, 1000), unit="ms"),
-    }
-
-    database.trace_item_buffer.append(trace_item)
-    database.trace_item_lookup[trace_item["id"]] = trace_item
+        # equal value hashes have equal inputs, so also the lineage rows are shared
+        lineage_columns = database.lineage_buffer.columns
+        for input_value_hash, _ in input_items:  # type: ignore
+            lineage_columns["value_hash"].append(input_value_hash)
+            lineage_columns["is_input_for_value_hash"].append(value_hash)
 
     if item_type == "I":
         insert_parsed_instruction(representation, value_hash, database)
     elif item_type == "D":
-        insert_parsed_dedup(representation, value_hash, database)
+        insert_parsed_dedup(representation, value_hash, input_items, database)
     elif item_type == "L":
         insert_parsed_literal(representation, value_hash, database)
     elif item_type == "C":
@@ -66,19 +131,32 @@ def insert_parsed_row(lineage_row_data, trace_id, database):
         raise Exception("Invalid item type")
 
 
+def has_unresolved_inputs(lineage_row_data, database):
+    """
+    True if an input of the row was not inserted yet.
+    """
+    representation = lineage_row_data.get("representation", {})
+    return any(
+        input not in database.trace_item_lookup
+        for input in representation.get("inputs", [])
+    )
+
+
 def insert_parsed_instruction(representation, value_hash, database):
-    instruction_item = {
-        "value_hash": value_hash,
-        "execution_type": np.random.choice(
-            ["CP", "CP_FILE", "SPARK", "GPU", "FED"], p=[0.9, 0.01, 0.04, 0.05, 0]
-        ),
-    } | representation
-    database.instruction_buffer.append(instruction_item)
+    database.instruction_buffer.append(
+        value_hash,
+        representation["op_code"],
+        representation.get("special_value_bits"),
+        random.choices(execution_types, execution_type_weights)[0],
+    )
 
 
-def insert_parsed_dedup(representation, value_hash, database):
-    representation.pop("inputs")
-    database.dedup_buffer.append(representation | {"value_hash": value_hash})
+def insert_parsed_dedup(representation, value_hash, input_items, database):
+    # inputs in order, the i-th input is bound to placeholder IN#i of the patch
+    input_hashes = [input_value_hash for input_value_hash, _ in input_items]
+    database.dedup_buffer.append(
+        value_hash, representation["dedup_name"], input_hashes
+    )
 
 
 def to_bool(x):
@@ -91,49 +169,93 @@ def to_bool(x):
 
 
 def insert_parsed_literal(representation, value_hash, database):
-    representation["flag"] = to_bool(representation["flag"])
-    database.literal_buffer.append(representation | {"value_hash": value_hash})
+    database.literal_buffer.append(
+        value_hash,
+        representation["value"],
+        representation["data_type"],
+        representation["value_type"],
+        to_bool(representation["flag"]),
+    )
 
 
 def insert_parsed_creation(representation, value_hash, database):
-    params = representation.pop("params", None)
-    database.creation_buffer.append(representation | {"value_hash": value_hash})
-    if "creation_method" not in representation:
+    if "dedup_in" in representation:
+        # placeholder for an input of a dedup patch
+        database.creation_buffer.append(
+            value_hash, None, None, int(representation["dedup_in"])
+        )
         return
-    if representation["creation_method"] == "rand":
+    creation_method = representation["creation_method"]
+    database.creation_buffer.append(
+        value_hash, representation["execution_type"], creation_method, None
+    )
+    params = representation["params"]
+    if creation_method == "rand":
         pdf = {k: v for d in params["other_params"] for k, v in d.items()}["pdf"]
         params["other_params"].remove({"pdf": pdf})
         database.rand_creation_buffer.append(
-            params | {"value_hash": value_hash, "pdf": pdf}
+            value_hash, pdf, params["other_params"]
+        )
+    elif creation_method == "createvar":
+        database.createvar_creation_buffer.append(
+            value_hash,
+            params["function"],
+            params["file_name"],
+            to_bool(params["file_overwrite"]),
+            params["data_type"],
+            params["format"],
+            params["other_params"],
         )
-    elif representation["creation_method"] == "createvar":
-        params["file_overwrite"] = to_bool(params["file_overwrite"])
-        database.createvar_creation_buffer.append(params | {"value_hash": value_hash})
-    elif representation["creation_method"] == "seq":
-        database.seq_creation_buffer.append(params | {"value_hash": value_hash})
+    elif creation_method == "seq":
+        database.seq_creation_buffer.append(value_hash, params["other_params"])
 
 
-def get_value_hash(lineage_row_data, inputs):
+def canonical_fields(representation):
+    """
+    Flatten a parsed representation to its keys and values in parse order.
+    Lists are enclosed in control characters, which can not occur in a trace.
+    """
+    if isinstance(representation, dict):
+        for key, value in representation.items():
+            yield key
+            yield from canonical_fields(value)
+    elif isinstance(representation, list):
+        yield "\x02"
+        for value in representation:
+            yield from canonical_fields(value)
+        yield "\x03"
+    else:
+        yield representation
+
+
+def get_value_hash(lineage_row_data, inputs, hash_backend="sha256"):
     item_type = lineage_row_data["type"]
     representation = lineage_row_data["representation"]
     str_to_hash = ""
 
     if item_type in ["C", "L"]:
-        str_to_hash = json.dumps(representation)
+        if hash_backend == "sha256":
+            # kept for compatibility with hashes of earlier versions
+            str_to_hash = json.dumps(representation)
+        elif item_type == "L":
+            # literals are flat dicts of strings
+            str_to_hash = "L\x1f" + "\x1f".join(representation.values())
+        else:
+            str_to_hash = "C\x1f" + "\x1f".join(canonical_fields(representation))
     elif item_type == "I":
-        str_to_hash = "".join([input["value_hash"] for input in inputs])
+        str_to_hash = "".join([value_hash for value_hash, _ in inputs])
         str_to_hash += representation["op_code"]
         str_to_hash += representation.get("special_value_bits", "")
     elif item_type == "D":
-        str_to_hash = "".join([input["value_hash"] for input in inputs])
+        str_to_hash = "".join([value_hash for value_hash, _ in inputs])
         str_to_hash += representation["dedup_name"]
     else:
         raise Exception("Invalid item type")
 
-    return hashlib.sha256(str_to_hash.encode()).hexdigest()
+    return hash_backends[hash_backend](str_to_hash.encode())
 
 
-def get_lineage_hash(lineage_row_data, inputs):
+def get_lineage_hash(lineage_row_data, inputs, hash_backend="sha256"):
     item_type = lineage_row_data["type"]
     representation = lineage_row_data["representation"]
     str_to_hash = ""
@@ -142,16 +264,27 @@ def get_lineage_hash(lineage_row_data, inputs):
         str_to_hash = item_type
     elif item_type == "C":
         str_to_hash = item_type
-        str_to_hash += representation["creation_method"]
+        if "dedup_in" in representation:
+            str_to_hash += "IN#" + representation["dedup_in"]
+        else:
+            str_to_hash += representation["creation_method"]
     elif item_type == "I":
-        str_to_hash = "".join([input["lineage_hash"] for input in inputs])
+        str_to_hash = "".join([lineage_hash for _, lineage_hash in inputs])
         str_to_hash += representation["op_code"]
         # to do: decide if we want to include special_value_bits in lineage_hash
         # document this decision
     elif item_type == "D":
-        str_to_hash = "".join([input["lineage_hash"] for input in inputs])
+        str_to_hash = "".join([lineage_hash for _, lineage_hash in inputs])
         str_to_hash += representation["dedup_name"]
     else:
         raise Exception("Invalid item type")
 
-    return hashlib.sha256(str_to_hash.encode()).hexdigest()
+    return hash_backends[hash_backend](str_to_hash.encode())
+
+
+def hashes_to_int64(hex_hashes):
+    """
+    Convert hex digests to 64 bit integers made of their first 8 bytes.
+    """
+    hex_prefixes = "".join([hex_hash[:16] for hex_hash in hex_hashes])
+    return np.frombuffer(bytes.fromhex(hex_prefixes), dtype=">i8").astype("int64")
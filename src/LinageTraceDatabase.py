@@ -1,4 +1,56 @@
 import pandas as pd
+import json
+import pathlib
+import time
+from ItemLoader import hashes_to_int64, hash_backends
+
+
+class ColumnBuffer:
+    """
+    Rows of one table that were not converted to a dataframe yet,
+    stored as one list per column.
+
+    Attributes
+    ----------
+    columns : dict of str to list
+        Values of each column, in schema order.
+    """
+
+    def __init__(self, columns):
+        self.columns = {column: [] for column in columns}
+        self.appends = [values.append for values in self.columns.values()]
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def append(self, *row):
+        """
+        Append one row, given as values of all columns in schema order.
+        """
+        for append, value in zip(self.appends, row):
+            append(value)
+
+    def append_record(self, record):
+        """
+        Append one row given as dict, missing columns are set to None.
+        Meant for tables with few rows, like the trace table.
+        """
+        self.append(*[record.get(column) for column in self.columns])
+
+    def extend(self, other):
+        for values, other_values in zip(self.columns.values(), other.columns.values()):
+            values.extend(other_values)
+
+    def filter(self, keep):
+        """
+        Keep only the rows for which keep is True.
+        """
+        for values in self.columns.values():
+            values[:] = [value for value, k in zip(values, keep) if k]
+
+    def clear(self):
+        for values in self.columns.values():
+            values.clear()
 
 
 class LineageTraceDatabase:
@@ -10,6 +62,8 @@ class LineageTraceDatabase:
         "file": "string",
         "name": "string",
         "description": "string",
+        "file_size": "Int64",
+        "file_hash": "string",
     }
 
     instruction_schema = {
@@ -26,6 +80,7 @@ class LineageTraceDatabase:
         # index
         "value_hash": "string",
         "dedup_name": "string",
+        "input_hashes": "object",
     }
 
     creation_schema = {
@@ -108,6 +163,68 @@ class LineageTraceDatabase:
         "execution_time": "timedelta64[ns]",
     }
 
+    patch_file_schema = {
+        # index
+        "file": "string",
+        "date": "datetime64[ns, UTC]",
+        "file_size": "Int64",
+        "file_hash": "string",
+    }
+
+    patch_item_schema = {
+        # both are index
+        "patch_name": "string",
+        "id": "int",
+        "type": pd.CategoricalDtype(
+            categories=["INSTRUCTION", "CREATION", "LITERAL", "DEDUP"]
+        ),
+        "value_hash": "string",
+        "lineage_hash": "string",
+    }
+
+    trace_value_schema = {
+        # both are index
+        "trace_id": "int",
+        "value_hash": "string",
+    }
+
+    # table name: (index columns, drop rows with duplicated index)
+    tables = {
+        "trace": ("id", False),
+        "instruction": ("value_hash", True),
+        "dedup": ("value_hash", True),
+        "creation": ("value_hash", True),
+        "rand_creation": ("value_hash", True),
+        "createvar_creation": ("value_hash", True),
+        "seq_creation": ("value_hash", True),
+        "literal": ("value_hash", True),
+        "lineage": (["value_hash", "is_input_for_value_hash"], True),
+        "trace_item": (["trace_id", "id"], False),
+        # value hashes used by each trace, the rows of the other tables
+        # are shared by all traces and only buffered once
+        "trace_value": (["trace_id", "value_hash"], True),
+        # .dedup files and the items of their patches, the templates of dedup items.
+        # Item ids are only unique within a patch.
+        "patch_file": ("file", True),
+        "patch_item": (["patch_name", "id"], True),
+    }
+
+    # tables indexed by trace_id first, besides trace
+    trace_id_tables = ["trace_item", "trace_value"]
+    # tables of .dedup files, rows of a reloaded file replace the earlier ones
+    patch_tables = ["patch_file", "patch_item"]
+
+    # columns holding value or lineage hashes
+    hash_columns = ["value_hash", "lineage_hash", "is_input_for_value_hash"]
+    # columns holding lists of value hashes
+    hash_list_columns = ["input_hashes"]
+
+    # hash_format: dtype of the hash columns
+    hash_dtypes = {"hex": "string", "int64": "int64"}
+
+    # settings stored in the metadata, databases with different settings are never mixed
+    default_settings = {"hash_format": "hex", "hash_backend": "sha256"}
+
     op_info_schema = {
         # index
         "op_code": "string",
@@ -116,106 +233,360 @@ class LineageTraceDatabase:
         "cp_type": "string",
     }
 
-    def __init__(self):
-        self.trace_buffer = []
-        self.instruction_buffer = []
-        self.dedup_buffer = []
-        self.creation_buffer = []
-        self.rand_creation_buffer = []
-        self.createvar_creation_buffer = []
-        self.seq_creation_buffer = []
-        self.literal_buffer = []
-        self.lineage_buffer = []
-        self.trace_item_buffer = []
+    op_info_path = pathlib.Path(__file__).resolve().parent.parent / "op_info.csv"
+    # op_info read by read_op_info
+    op_info_table = None
+
+    def __init__(self, hash_format="hex", hash_backend="sha256"):
+        """
+        Parameters
+        ----------
+        hash_format : str, default="hex"
+            How value and lineage hashes are stored in the dataframes.
+            'hex' keeps the hex digests as strings.
+            'int64' stores the first 8 bytes of the digest as integer,
+            which needs a fraction of the memory and joins much faster.
+        hash_backend : str, default="sha256"
+            Hash function for value and lineage hashes.
+            'sha256' gives the same hashes as earlier versions.
+            'blake2b' (and 'xxh3' if xxhash is installed) are faster 128 bit hashes
+            of the parsed fields, that do not serialize items to json first.
+        """
+        if hash_format not in self.hash_dtypes:
+            raise RuntimeError("hash_format must be either 'hex' or 'int64'")
+        if hash_backend not in hash_backends:
+            raise RuntimeError(
+                "hash_backend must be one of " + ", ".join(hash_backends)
+            )
+        # settings of the database, stored alongside the tables by save
+        self.metadata = {"hash_format": hash_format, "hash_backend": hash_backend}
+        # LoadStats collected while loading, disabled if None
+        self.stats = None
+        # SqlTraceDatabase that flush_buffers writes to instead of chunks, if set
+        self.sink = None
+        # chunks and buffer of the tables that were not built yet, see to_pandas
+        self.unconverted = {}
+        self.clear_buffers()
+
+    def settings(self):
+        """
+        Settings of this database, as passed to the constructor.
+        """
+        return {key: self.metadata[key] for key in self.default_settings}
+
+    def empty_copy(self):
+        """
+        Create a database without traces that uses the same settings as this one.
+        """
+        return LineageTraceDatabase(**self.settings())
+
+    def schema(self, table):
+        """
+        Schema of a table, with the dtype of the hash columns set by hash_format.
+        """
+        schema = dict(getattr(self, table + "_schema"))
+        for column in self.hash_columns:
+            if column in schema:
+                schema[column] = self.hash_dtypes[self.metadata["hash_format"]]
+        return schema
 
-        self.trace_item_lookup = {}
+    def clear_buffers(self):
+        # <table>_buffer holds the rows of each table as columns
+        for table in self.tables:
+            setattr(self, table + "_buffer", ColumnBuffer(self.schema(table)))
+
+        # dataframes of already flushed buffers
+        self.chunks = {table: [] for table in self.tables}
+
+        # hashes of the items of the trace currently loading, see load_trace
+        self.trace_item_lookup = None
+
+        # value hashes whose rows were buffered since the last to_pandas,
+        # and those already referenced by the trace currently loading
+        self.seen_value_hashes = set()
+        self.trace_value_hashes = set()
 
         self.current_dedup_patch = None
 
-    def to_pandas(self):
-        self.trace = (
-            pd.DataFrame.from_records(
-                self.trace_buffer, columns=self.trace_schema.keys()
-            )
-            .astype(self.trace_schema)
-            .set_index("id")
-        )
-        self.instruction = (
-            pd.DataFrame.from_records(
-                self.instruction_buffer, columns=self.instruction_schema.keys()
-            )
-            .astype(self.instruction_schema)
-            .set_index("value_hash")
-        )
-        self.instruction = self.instruction[~self.instruction.index.duplicated()]
-        self.dedup = (
-            pd.DataFrame.from_records(
-                self.dedup_buffer, columns=self.dedup_schema.keys()
-            )
-            .astype(self.dedup_schema)
-            .set_index("value_hash")
-        )
-        self.dedup = self.dedup[~self.dedup.index.duplicated()]
-        self.creation = (
-            pd.DataFrame.from_records(
-                self.creation_buffer, columns=self.creation_schema.keys()
-            )
-            .astype(self.creation_schema)
-            .set_index("value_hash")
-        )
-        self.creation = self.creation[~self.creation.index.duplicated()]
-        self.rand_creation = (
-            pd.DataFrame.from_records(
-                self.rand_creation_buffer, columns=self.rand_creation_schema.keys()
-            )
-            .astype(self.rand_creation_schema)
-            .set_index("value_hash")
-        )
-        self.rand_creation = self.rand_creation[~self.rand_creation.index.duplicated()]
-        self.createvar_creation = (
-            pd.DataFrame.from_records(
-                self.createvar_creation_buffer,
-                columns=self.createvar_creation_schema.keys(),
-            )
-            .astype(self.createvar_creation_schema)
-            .set_index("value_hash")
-        )
-        self.createvar_creation = self.createvar_creation[
-            ~self.createvar_creation.index.duplicated()
-        ]
-        self.seq_creation = (
-            pd.DataFrame.from_records(
-                self.seq_creation_buffer, columns=self.seq_creation_schema.keys()
-            )
-            .astype(self.seq_creation_schema)
-            .set_index("value_hash")
-        )
-        self.seq_creation = self.seq_creation[~self.seq_creation.index.duplicated()]
-        self.literal = (
-            pd.DataFrame.from_records(
-                self.literal_buffer, columns=self.literal_schema.keys()
-            )
-            .astype(self.literal_schema)
-            .set_index("value_hash")
-        )
-        self.literal = self.literal[~self.literal.index.duplicated()]
-        self.lineage = (
-            pd.DataFrame.from_records(
-                self.lineage_buffer, columns=self.lineage_schema.keys()
-            )
-            .astype(self.lineage_schema)
-            .set_index(["value_hash", "is_input_for_value_hash"])
-        )
-        self.lineage = self.lineage[~self.lineage.index.duplicated()]
-        self.trace_item = (
-            pd.DataFrame.from_records(
-                self.trace_item_buffer, columns=self.trace_item_schema.keys()
+    def extend_buffers(self, other):
+        """
+        Append the buffered rows of another database to this one.
+        Trace ids of the other database are shifted to follow the traces
+        already buffered here, so merging in a fixed order gives the same ids
+        as loading all traces into this database one after another.
+        Buffered rows of value hashes already seen here are skipped,
+        rows in flushed chunks are deduplicated by to_pandas.
+
+        Parameters
+        ----------
+        other : LineageTraceDatabase
+            Database with loaded traces, that was not yet converted to pandas.
+        """
+        id_offset = len(self.trace_buffer)
+        for buffer, column in [(other.trace_buffer, "id")] + [
+            (getattr(other, table + "_buffer"), "trace_id")
+            for table in self.trace_id_tables
+        ]:
+            ids = buffer.columns[column]
+            ids[:] = [id + id_offset for id in ids]
+
+        if self.stats is not None and other.stats is not None:
+            self.stats.extend(other.stats)
+
+        if any(other.chunks.values()):
+            # keep rows in load order
+            self.flush_buffers()
+        for table in self.trace_id_tables:
+            for chunk in other.chunks[table]:
+                chunk.index = chunk.index.set_levels(
+                    chunk.index.levels[0] + id_offset, level="trace_id"
+                )
+        new_hashes = other.seen_value_hashes - self.seen_value_hashes
+        for table, (index, deduplicate) in self.tables.items():
+            if self.sink is None:
+                self.chunks[table].extend(other.chunks[table])
+            else:
+                for chunk in other.chunks[table]:
+                    self.sink.write_frame(table, chunk)
+            buffer = getattr(other, table + "_buffer")
+            if index == "value_hash" or table == "lineage":
+                # the lineage rows of an item belong to its value hash
+                column = "is_input_for_value_hash" if table == "lineage" else index
+                buffer.filter([value in new_hashes for value in buffer.columns[column]])
+            getattr(self, table + "_buffer").extend(buffer)
+        self.seen_value_hashes |= new_hashes
+
+    def merge(self, other, trace_ids):
+        """
+        Merge the tables of another database into this one.
+        Both databases have to be converted to pandas already.
+
+        Parameters
+        ----------
+        other : LineageTraceDatabase
+            Database with the newly loaded traces.
+        trace_ids : list of int
+            Trace id in this database for each trace of other, by position.
+            Traces of this database with one of these ids are replaced.
+            Patches of reloaded .dedup files are replaced as well.
+            Rows of value hashes that are no longer used by any trace
+            or patch are dropped.
+        """
+        if other.settings() != self.settings():
+            raise RuntimeError("can not merge databases with different settings")
+        id_map = dict(enumerate(trace_ids))
+        replaced_ids = self.trace.index.intersection(trace_ids)
+
+        self.trace = pd.concat(
+            [self.trace.drop(index=replaced_ids), other.trace.rename(index=id_map)]
+        ).sort_index()
+        for table in self.trace_id_tables:
+            df = pd.concat(
+                [
+                    getattr(self, table).drop(index=replaced_ids, level="trace_id"),
+                    getattr(other, table).rename(index=id_map, level="trace_id"),
+                ]
             )
-            .astype(self.trace_item_schema)
-            .set_index(["trace_id", "id"])
+            setattr(self, table, df)
+
+        for table in self.patch_tables:
+            df = getattr(self, table)
+            other_df = getattr(other, table)
+            setattr(self, table, pd.concat([df[~df.index.isin(other_df.index)], other_df]))
+
+        used_hashes = self.trace_value.index.get_level_values("value_hash").union(
+            self.patch_item.value_hash
         )
-        self.op_info = pd.read_csv(
-            "op_info.csv", dtype=self.op_info_schema, sep=";"
-        ).set_index("op_code")
+        for table, (index, deduplicate) in self.tables.items():
+            if table == "trace" or table in self.trace_id_tables + self.patch_tables:
+                continue
+            df = pd.concat([getattr(self, table), getattr(other, table)])
+            df = df[~df.index.duplicated()]
+            if len(replaced_ids) > 0:
+                if table == "lineage":
+                    df = df[
+                        df.index.get_level_values("is_input_for_value_hash").isin(
+                            used_hashes
+                        )
+                    ]
+                else:
+                    df = df[df.index.isin(used_hashes)]
+            setattr(self, table, df)
+
+    def buffer_to_frame(self, table, buffer=None):
+        """
+        Convert the rows of a ColumnBuffer to a dataframe of table.
+        The buffer of the table if buffer is None.
+        """
+        if buffer is None:
+            buffer = getattr(self, table + "_buffer")
+        index, deduplicate = self.tables[table]
+        schema = self.schema(table)
+        df = pd.DataFrame(buffer.columns, columns=schema.keys())
+        if self.metadata["hash_format"] == "int64":
+            for column in self.hash_columns:
+                if column in schema:
+                    df[column] = hashes_to_int64(df[column])
+            for column in self.hash_list_columns:
+                if column in schema:
+                    df[column] = [
+                        hashes_to_int64(hashes).tolist() for hashes in df[column]
+                    ]
+        df = df.astype(schema)
+        # set_index can turn a few integer hashes into an overflowing RangeIndex
+        if isinstance(index, list):
+            df.index = pd.MultiIndex.from_frame(df[index])
+        else:
+            df.index = pd.Index(df[index])
+        df = df.drop(columns=index)
+        if deduplicate:
+            df = df[~df.index.duplicated()]
+        return df
+
+    def flush_buffers(self):
+        """
+        Convert the buffered rows to dataframe chunks and empty the buffers.
+        Keeps memory bounded while loading large traces.
+        If sink is set, the chunks are inserted into it instead of kept.
+        The trace buffer is not flushed, its length is used to number new traces.
+        """
+        if self.stats is not None:
+            self.stats.record_buffers(self)
+        for table in self.tables:
+            buffer = getattr(self, table + "_buffer")
+            if table == "trace" or len(buffer) == 0:
+                continue
+            df = self.buffer_to_frame(table)
+            if self.sink is None:
+                self.chunks[table].append(df)
+            else:
+                self.sink.write_frame(table, df)
+            buffer.clear()
+
+    def to_pandas(self, lazy=True):
+        """
+        Make the buffered rows available as one dataframe per table
+        and empty the buffers for the next load.
+
+        Parameters
+        ----------
+        lazy : bool, default=True
+            Build the dataframe of each table on first access of the attribute,
+            so tables that are never used cost nothing.
+            If False, all tables are built right away.
+        """
+        if self.stats is not None:
+            self.stats.record_buffers(self)
+        self.unconverted = {
+            table: (self.chunks[table], getattr(self, table + "_buffer"))
+            for table in self.tables
+        }
+        for table in self.tables:
+            # drop tables of an earlier call, so the attribute is looked up again
+            self.__dict__.pop(table, None)
+        self.op_info = self.read_op_info()
+        self.clear_buffers()
+        if not lazy:
+            for table in self.tables:
+                getattr(self, table)
+
+    def __getattr__(self, name):
+        # only called for missing attributes, that is tables not built yet
+        unconverted = self.__dict__.get("unconverted", {})
+        if name not in unconverted:
+            raise AttributeError(name)
+        start = time.perf_counter()
+        chunks, buffer = unconverted.pop(name)
+        if len(buffer) > 0 or len(chunks) == 0:
+            chunks = chunks + [self.buffer_to_frame(name, buffer)]
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+        if self.tables[name][1] and len(chunks) > 1:
+            df = df[~df.index.duplicated()]
+        setattr(self, name, df)
+        if self.stats is not None:
+            self.stats.record_to_pandas({name: time.perf_counter() - start})
+        return df
+
+    @classmethod
+    def read_op_info(cls):
+        """
+        The op_info table from op_info.csv in the repository root.
+        Read once per process, all databases share the same dataframe.
+        """
+        if cls.op_info_table is None:
+            op_info = pd.read_csv(cls.op_info_path, dtype=cls.op_info_schema, sep=";")
+            cls.op_info_table = op_info.set_index("op_code")
+        return cls.op_info_table
+
+    def save(self, path):
+        """
+        Save all tables to a directory of parquet files.
+        Columns holding python objects are stored as json strings.
+
+        Parameters
+        ----------
+        path : str
+            Directory to write to. Is created if it does not exist.
+        """
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for table in list(self.tables) + ["op_info"]:
+            df = getattr(self, table)
+            for column, dtype in getattr(self, table + "_schema").items():
+                if dtype == "object":
+                    df = df.assign(**{column: df[column].map(json.dumps)})
+            df.to_parquet(path / (table + ".parquet"))
+        with open(path / "metadata.json", "w", encoding="utf-8") as metadata_file:
+            json.dump(self.metadata, metadata_file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a database written by save.
+
+        Parameters
+        ----------
+        path : str
+            Directory the database was saved to.
+
+        Returns
+        -------
+        LineageTraceDatabase
+            Database with all tables loaded as pandas dataframes.
+        """
+        path = pathlib.Path(path)
+        database = cls()
+        database.metadata = cls.default_settings | cls.read_metadata(path)
+        for table in list(cls.tables) + ["op_info"]:
+            df = pd.read_parquet(path / (table + ".parquet"))
+            schema = database.schema(table)
+            for column, dtype in getattr(cls, table + "_schema").items():
+                if dtype == "object":
+                    df[column] = df[column].map(json.loads)
+                elif isinstance(dtype, pd.CategoricalDtype):
+                    # parquet does not keep the categories of empty columns
+                    df[column] = df[column].astype(dtype)
+            # parquet reads string index levels back as str
+            if isinstance(df.index, pd.MultiIndex):
+                df.index = pd.MultiIndex.from_arrays(
+                    [
+                        df.index.get_level_values(level).astype(schema[level])
+                        for level in df.index.names
+                    ]
+                )
+            else:
+                df.index = df.index.astype(schema[df.index.name])
+            setattr(database, table, df)
+        return database
 
-        self.__init__()
+    @staticmethod
+    def read_metadata(path):
+        """
+        Read the metadata of a saved database without loading its tables.
+        Returns an empty dict if there is no saved database at path.
+        """
+        metadata_path = pathlib.Path(path) / "metadata.json"
+        if not metadata_path.exists():
+            return {}
+        with open(metadata_path, "r", encoding="utf-8") as metadata_file:
+            return json.load(metadata_file)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+
+class LineageGraph:
+    """
+    Adjacency index of the lineage table in compressed sparse row format.
+
+    Every value hash in the lineage table gets an integer node id.
+    Edges point from an input to the item it is an input for.
+
+    Attributes
+    ----------
+    lineage : pandas.DataFrame
+        The lineage table the graph was built from.
+    nodes : pandas.Index
+        Value hash of each node id.
+    sources, targets : numpy.ndarray
+        Node ids of the input and of the consuming item of each lineage row.
+    forward : tuple of numpy.ndarray
+        (indptr, indices) of the edges from inputs to consuming items.
+    reverse : tuple of numpy.ndarray
+        (indptr, indices) of the edges from consuming items to their inputs.
+    """
+
+    def __init__(self, lineage):
+        """
+        Parameters
+        ----------
+        lineage : pandas.DataFrame
+            Lineage table indexed by (value_hash, is_input_for_value_hash).
+        """
+        self.lineage = lineage
+        inputs = lineage.index.get_level_values("value_hash")
+        outputs = lineage.index.get_level_values("is_input_for_value_hash")
+        codes, self.nodes = pd.factorize(inputs.append(outputs))
+        self.sources = codes[: len(lineage)]
+        self.targets = codes[len(lineage) :]
+        self.forward = self.csr(self.sources, self.targets, len(self.nodes))
+        self.reverse = self.csr(self.targets, self.sources, len(self.nodes))
+
+    @staticmethod
+    def csr(sources, targets, num_nodes):
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+        return indptr, targets[order]
+
+    def node_ids(self, value_hashes):
+        """
+        Node ids of the given value hashes. Hashes without lineage are left out.
+        """
+        node_ids = self.nodes.get_indexer(value_hashes)
+        return node_ids[node_ids >= 0]
+
+    def bfs(self, start_ids, adjacency, max_depth=None):
+        """
+        Breadth first search that expands the whole frontier at once.
+
+        Parameters
+        ----------
+        start_ids : numpy.ndarray
+            Node ids to start from.
+        adjacency : tuple of numpy.ndarray
+            Either forward or reverse.
+        max_depth : int, default=None
+            Maximum number of hops. Unlimited if None.
+
+        Returns
+        -------
+        numpy.ndarray
+            Hop distance of every node, -1 for nodes that were not reached.
+        """
+        indptr, indices = adjacency
+        distance = np.full(len(self.nodes), -1, dtype=np.int64)
+        frontier = np.unique(start_ids)
+        distance[frontier] = 0
+        depth = 0
+        while len(frontier) > 0 and (max_depth is None or depth < max_depth):
+            depth += 1
+            starts = indptr[frontier]
+            counts = indptr[frontier + 1] - starts
+            total = counts.sum()
+            if total == 0:
+                break
+            # positions of all neighbours of the frontier in indices
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            neighbours = np.unique(indices[offsets + np.arange(total)])
+            frontier = neighbours[distance[neighbours] < 0]
+            distance[frontier] = depth
+        return distance
+
+    def reachable(self, value_hash, adjacency, max_depth=None):
+        distance = self.bfs(self.node_ids([value_hash]), adjacency, max_depth)
+        reached = distance > 0
+        return (
+            pd.DataFrame(
+                {"distance": distance[reached]},
+                index=self.nodes[reached].rename("value_hash"),
+            )
+            .sort_values("distance", kind="stable")
+        )
+
+    def ancestors(self, value_hash, max_depth=None):
+        return self.reachable(value_hash, self.reverse, max_depth)
+
+    def descendants(self, value_hash, max_depth=None):
+        return self.reachable(value_hash, self.forward, max_depth)
+
+    def subgraph_between(self, from_value_hash, to_value_hash):
+        """
+        Lineage rows on any path from from_value_hash to to_value_hash.
+        """
+        after = self.bfs(self.node_ids([from_value_hash]), self.forward) >= 0
+        before = self.bfs(self.node_ids([to_value_hash]), self.reverse) >= 0
+        on_path = after & before
+        return self.lineage[on_path[self.sources] & on_path[self.targets]]
@@ -28,7 +28,7 @@ op_code = Word(printables)("op_code")
 special_value_bits = Word(nums)("special_value_bits")
 special_value_bits_item = "[" + special_value_bits + "]"
 
-l_placeholder = Literal("IN#") + Word(nums)("dudup_in")
+l_placeholder = Literal("IN#") + Word(nums)("dedup_in")
 inputs = id_as_input[1, ...]("inputs")
 
 execution_type = (
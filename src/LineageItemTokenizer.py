@@ -0,0 +1,240 @@
+"""
+Split based tokenizer for lineage trace records.
+
+For well formed lines ``tokenize_record`` returns exactly the same dict as
+``trace_record.parse_string(line).as_dict()`` from LineageItemGrammar, but
+without the pyparsing overhead. Whenever a line can not be tokenized
+unambiguously it returns None and the caller has to fall back to the grammar.
+"""
+import re
+
+DATA_TYPES = frozenset(["SCALAR", "FRAME", "MATRIX", "LIST"])
+VALUE_TYPES = frozenset(["INT64", "FP64", "STRING", "BOOLEAN"])
+FLAGS = frozenset(["true", "false"])
+# CP_FILE is shadowed by CP in the grammar and never parses, so it is left out
+EXECUTION_TYPES = frozenset(["CP", "SPARK", "GPU", "FED"])
+DISTRIBUTIONS = ("uniform", "normal", "poisson")
+CREATEVAR_FORMATS = ("csv", "libsvm", "hdf5", "text")
+
+record_header = re.compile(r"\(([0-9]+)\) \(([LCID])\) (.+)")
+instruction_content = re.compile(r"([!-~]+)((?: \([0-9]+\))+)(?: \[([0-9]+)\])?")
+dedup_content = re.compile(r"([!-~]+)((?: \([0-9]+\))+)")
+input_id = re.compile(r"[0-9]+")
+placeholder = re.compile(r"IN#([0-9]+)")
+# an instruction line as bytes, including the line break
+instruction_line = re.compile(
+    rb"\(([0-9]+)\) \(I\) ([!-~]+)((?: \([0-9]+\))+)(?: \[([0-9]+)\])?\r?\n?"
+)
+float_prefix = re.compile(r"-?[0-9]+\.[0-9]+")
+float_value = re.compile(r"-?[0-9]+\.[0-9]+(?:[Ee]-?[0-9]+)?")
+int_value = re.compile(r"[0-9]+")
+
+
+def is_word(s):
+    # Word(printables)
+    return s != "" and s.isascii() and s.isprintable() and " " not in s
+
+
+def is_any_value(s):
+    # Word(printables + " ", excludeChars="°·"), leading whitespace is skipped
+    return s != "" and s.isascii() and s.isprintable() and s[0] != " "
+
+
+def is_any_non_circle(s):
+    # Word(printables + "·", excludeChars="°")
+    if s == "":
+        return False
+    s = s.replace("·", "")
+    return s == "" or is_word(s)
+
+
+def tokenize_literal(content):
+    parts = content.split("·")
+    if (
+        len(parts) != 4
+        or not is_any_value(parts[0])
+        or parts[1] not in DATA_TYPES
+        or parts[2] not in VALUE_TYPES
+        or parts[3] not in FLAGS
+    ):
+        return None
+    return {
+        "value": parts[0],
+        "data_type": parts[1],
+        "value_type": parts[2],
+        "flag": parts[3],
+    }
+
+
+def tokenize_param(param):
+    if param == "":
+        return None
+    if "·" in param:
+        literal = tokenize_literal(param)
+        if literal is not None:
+            return literal
+        if param.count("·") >= 3:
+            # the grammar might match parts of this as a literal
+            return None
+    if float_prefix.match(param):
+        return {"value": param} if float_value.fullmatch(param) else None
+    if param[0] in "0123456789":
+        return {"value": param} if int_value.fullmatch(param) else None
+    if param.startswith(DISTRIBUTIONS):
+        return {"pdf": param} if param in DISTRIBUTIONS else None
+    if is_any_non_circle(param):
+        return {"value": param}
+    return None
+
+
+def tokenize_creation(content):
+    match = placeholder.fullmatch(content)
+    if match:
+        return {"dedup_in": match.group(1)}
+    parts = content.split("°")
+    if len(parts) < 2 or parts[0] not in EXECUTION_TYPES:
+        return None
+
+    creation_method = parts[1]
+    if creation_method in ("rand", "seq"):
+        params = {}
+        other = parts[2:]
+    elif creation_method == "createvar":
+        if len(parts) < 7:
+            return None
+        function, file_name, file_overwrite, data_type, format = parts[2:7]
+        if (
+            not is_any_non_circle(function)
+            or not is_any_non_circle(file_name)
+            or file_overwrite not in FLAGS
+            or data_type not in DATA_TYPES
+            or not is_any_non_circle(format)
+        ):
+            return None
+        if format.startswith(CREATEVAR_FORMATS) and format not in CREATEVAR_FORMATS:
+            return None
+        params = {
+            "function": function,
+            "file_name": file_name,
+            "file_overwrite": file_overwrite,
+            "data_type": data_type,
+            "format": format,
+        }
+        other = parts[7:]
+    else:
+        return None
+
+    other_params = []
+    for param in other:
+        tokens = tokenize_param(param)
+        if tokens is None:
+            return None
+        other_params.append(tokens)
+    params["other_params"] = other_params
+
+    return {
+        "execution_type": parts[0],
+        "creation_method": creation_method,
+        "params": params,
+    }
+
+
+def tokenize_instruction(content):
+    match = instruction_content.fullmatch(content)
+    if match is None:
+        return None
+    representation = {
+        "op_code": match.group(1),
+        "inputs": input_id.findall(match.group(2)),
+    }
+    if match.group(3) is not None:
+        representation["special_value_bits"] = match.group(3)
+    return representation
+
+
+def tokenize_dedup(content):
+    match = dedup_content.fullmatch(content)
+    if match is None:
+        return None
+    return {
+        "dedup_name": match.group(1),
+        "inputs": input_id.findall(match.group(2)),
+    }
+
+
+item_tokenizers = {
+    "L": tokenize_literal,
+    "C": tokenize_creation,
+    "I": tokenize_instruction,
+    "D": tokenize_dedup,
+}
+
+
+def tokenize_record(line):
+    """
+    Tokenize a single line of a lineage trace.
+
+    Parameters
+    ----------
+    line : str
+        Line of a lineage trace, including the trailing newline if present.
+
+    Returns
+    -------
+    dict or None
+        Same dict as the pyparsing grammar would return,
+        or None if the line has to be parsed by the grammar.
+    """
+    if line == "" or line == "\n":
+        return {"patch_end": line}
+    if line[-1] == "\n":
+        line = line[:-1]
+
+    if line.startswith("patch_"):
+        patch_id = line[len("patch_") :]
+        return {"patch_id": patch_id} if is_word(patch_id) else None
+
+    match = record_header.fullmatch(line)
+    if match is None:
+        return None
+    item_type = match.group(2)
+    representation = item_tokenizers[item_type](match.group(3))
+    if representation is None:
+        return None
+    return {
+        "id": match.group(1),
+        "type": item_type,
+        "representation": representation,
+    }
+
+
+def tokenize_instruction_line(buffer, start, end):
+    """
+    Tokenize an instruction line directly from a bytes-like buffer,
+    decoding only the fields of the result.
+
+    Parameters
+    ----------
+    buffer : bytes-like
+        Content of a trace file, for example a mmap.
+    start, end : int
+        Position of the line in buffer, end after the line break.
+
+    Returns
+    -------
+    dict or None
+        Same dict as tokenize_record, or None if the line is no instruction
+        and has to be decoded and passed to tokenize_record.
+    """
+    match = instruction_line.fullmatch(buffer, start, end)
+    if match is None:
+        return None
+    id, op_code, inputs, special_value_bits = match.groups()
+    representation = {
+        "op_code": op_code.decode(),
+        # " (1) (2)" -> ["1", "2"]
+        "inputs": inputs[2:-1].decode().split(") ("),
+    }
+    if special_value_bits is not None:
+        representation["special_value_bits"] = special_value_bits.decode()
+    return {"id": id.decode(), "type": "I", "representation": representation}
@@ -0,0 +1,144 @@
+import time
+import pandas as pd
+
+
+class LoadStats:
+    """
+    Timings and counts collected while loading traces.
+
+    Attach an instance to LineageTraceDatabase.stats (or pass it to load_directory)
+    to enable it. Without it the loader only checks for None once per row.
+
+    Attributes
+    ----------
+    files : list of dict
+        Statistics of every loaded file: 'file', 'lines', 'items' by type,
+        'seconds' per stage ('parse', 'hash', 'insert'), 'total_seconds'
+        and 'rows_per_second'. 'insert' excludes the time spent hashing.
+    to_pandas_seconds : dict of str to float
+        Time to build the dataframe of each table, on first access after to_pandas.
+    buffer_rows : dict of str to int
+        Largest number of buffered rows of each table, before a flush or to_pandas.
+    callback : callable, default=None
+        Called with the statistics of each file after it was loaded,
+        and with the time to build a table as {'to_pandas': {table: seconds}}.
+        Not sent to worker processes, it is called when their results are merged.
+    """
+
+    stages = ["parse", "hash", "insert"]
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.files = []
+        self.to_pandas_seconds = {}
+        self.buffer_rows = {}
+        self.current = None
+
+    def empty_copy(self):
+        """
+        Stats without callback, for loading in a worker process.
+        """
+        return LoadStats()
+
+    def start_file(self, path_to_file):
+        self.current = {
+            "file": str(path_to_file),
+            "lines": 0,
+            "items": {"L": 0, "C": 0, "I": 0, "D": 0},
+            "seconds": dict.fromkeys(self.stages, 0.0),
+            "start": time.perf_counter(),
+        }
+
+    def end_file(self):
+        file_stats = self.current
+        self.current = None
+        total_seconds = time.perf_counter() - file_stats.pop("start")
+        # insert_parsed_row is timed as a whole, hashing is measured inside of it
+        file_stats["seconds"]["insert"] -= file_stats["seconds"]["hash"]
+        file_stats["total_seconds"] = total_seconds
+        file_stats["rows_per_second"] = (
+            file_stats["lines"] / total_seconds if total_seconds > 0 else None
+        )
+        self.add_file(file_stats)
+
+    def add_file(self, file_stats):
+        self.files.append(file_stats)
+        if self.callback is not None:
+            self.callback(file_stats)
+
+    def timed_rows(self, rows):
+        """
+        Pass through parsed rows, adding the time to produce them to 'parse'
+        and counting the items by type.
+        """
+        seconds = self.current["seconds"]
+        items = self.current["items"]
+        rows = iter(rows)
+        while True:
+            start = time.perf_counter()
+            row = next(rows, None)
+            seconds["parse"] += time.perf_counter() - start
+            if row is None:
+                return
+            self.current["lines"] += 1
+            if "type" in row:
+                items[row["type"]] += 1
+            yield row
+
+    def add_time(self, stage, seconds):
+        self.current["seconds"][stage] += seconds
+
+    def record_buffers(self, database):
+        for table in database.tables:
+            rows = len(getattr(database, table + "_buffer"))
+            self.buffer_rows[table] = max(self.buffer_rows.get(table, 0), rows)
+
+    def record_to_pandas(self, seconds):
+        self.to_pandas_seconds.update(seconds)
+        if self.callback is not None:
+            self.callback({"to_pandas": seconds})
+
+    def extend(self, other):
+        """
+        Add the statistics of a worker process.
+        """
+        for file_stats in other.files:
+            self.add_file(file_stats)
+        for table, rows in other.buffer_rows.items():
+            self.buffer_rows[table] = max(self.buffer_rows.get(table, 0), rows)
+
+    def summary(self):
+        """
+        Totals over all files.
+
+        Returns
+        -------
+        dict
+            'files', 'lines', 'items' by type, 'seconds' per stage including
+            'to_pandas', 'rows_per_second' and 'buffer_rows'.
+        """
+        seconds = dict.fromkeys(self.stages, 0.0)
+        items = {"L": 0, "C": 0, "I": 0, "D": 0}
+        lines = 0
+        for file_stats in self.files:
+            lines += file_stats["lines"]
+            for stage in self.stages:
+                seconds[stage] += file_stats["seconds"][stage]
+            for item_type, count in file_stats["items"].items():
+                items[item_type] += count
+        seconds["to_pandas"] = sum(self.to_pandas_seconds.values())
+        total_seconds = sum(seconds.values())
+        return {
+            "files": len(self.files),
+            "lines": lines,
+            "items": items,
+            "seconds": seconds,
+            "rows_per_second": lines / total_seconds if total_seconds > 0 else None,
+            "buffer_rows": dict(self.buffer_rows),
+        }
+
+    def to_frame(self):
+        """
+        Statistics of all files as a DataFrame with one row per file.
+        """
+        return pd.json_normalize(self.files)
@@ -1,4 +1,8 @@
 import pandas as pd
+import numpy as np
+from LineageGraph import LineageGraph
+from CriticalPath import critical_path
+from TraceDivergence import PrefixHashIndex
 
 
 class QueryInterface:
@@ -21,6 +25,9 @@ class QueryInterface:
     find_trace_long_operation(min_time_ms = 20)
         Finds long operations within the traces with a minimum execution time.
 
+    execution_time_percentiles(by="trace_id", percentiles=(0.5, 0.95, 0.99))
+        Percentiles of the execution time per trace or op_code.
+
     compare_instruction_count()
         Compare instruction count in traces.
 
@@ -32,6 +39,24 @@ class QueryInterface:
 
     compare_traces_by_date(date1, date2, compare_by="lineage")
         Compare two different traces by their dates.
+
+    compare_traces_matrix(trace_ids=None, compare_by="lineage")
+        Compare all pairs of traces.
+
+    ancestors(value_hash, max_depth=None)
+        Find all items that an item was computed from.
+
+    descendants(value_hash, max_depth=None)
+        Find all items that were computed from an item.
+
+    subgraph_between(from_value_hash, to_value_hash)
+        Find the lineage connecting two items.
+
+    critical_path(trace_id=None)
+        Find the longest chain of dependent operations by execution time.
+
+    expand_dedup(value_hash)
+        Find the patch a dedup item stands for, with its inputs bound.
     """
 
     def __init__(self, database):
@@ -42,6 +67,92 @@ class QueryInterface:
             The database containing all traces
         """
         self.database = database
+        self.lineage_graph = None
+        self.prefix_hash_indexes = {}
+        self.enriched_trace_item = None
+        self.enriched_trace_item_sources = None
+
+    def get_enriched_trace_item(self):
+        """
+        Trace items joined with their instruction and op_info, reduced to the columns
+        used by the queries. Built on first use and rebuilt when one of the joined
+        tables was replaced.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by trace_id and id with columns 'type', 'execution_time',
+            'op_code', 'execution_type', 'group' and 'cp_type'.
+        """
+        sources = (
+            self.database.trace_item,
+            self.database.instruction,
+            self.database.op_info,
+        )
+        if self.enriched_trace_item_sources is None or any(
+            table is not cached_table
+            for table, cached_table in zip(sources, self.enriched_trace_item_sources)
+        ):
+            self.enriched_trace_item = (
+                self.database.trace_item[["type", "value_hash", "execution_time"]]
+                .join(
+                    self.database.instruction[["op_code", "execution_type"]],
+                    on="value_hash",
+                )
+                .join(self.database.op_info[["group", "cp_type"]], on="op_code")
+                .drop(columns="value_hash")
+            )
+            self.enriched_trace_item_sources = sources
+        return self.enriched_trace_item
+
+    def get_lineage_graph(self):
+        """
+        Index of the lineage table for graph traversal.
+        Built on first use and rebuilt when the lineage table was replaced.
+
+        Returns
+        -------
+        LineageGraph
+            Graph index of the current lineage table.
+        """
+        if (
+            self.lineage_graph is None
+            or self.lineage_graph.lineage is not self.database.lineage
+        ):
+            self.lineage_graph = LineageGraph(self.database.lineage)
+        return self.lineage_graph
+
+    def get_prefix_hash_index(self, compare_by):
+        """
+        Prefix hashes of all traces for divergence detection.
+        Built on first use and rebuilt when the trace_item table was replaced.
+
+        Parameters
+        ----------
+        compare_by : str
+            Either 'lineage' or 'value'.
+
+        Raises
+        ------
+        RuntimeError
+            If compare_by is neither 'lineage' nor 'value'.
+
+        Returns
+        -------
+        PrefixHashIndex
+            Prefix hashes of the lineage_hash or value_hash column.
+        """
+        if compare_by == "lineage":
+            compare_column = "lineage_hash"
+        elif compare_by == "value":
+            compare_column = "value_hash"
+        else:
+            raise RuntimeError("compare_by must be either 'lineage' or 'value'")
+        index = self.prefix_hash_indexes.get(compare_column)
+        if index is None or index.trace_item is not self.database.trace_item:
+            index = PrefixHashIndex(self.database.trace_item, compare_column)
+            self.prefix_hash_indexes[compare_column] = index
+        return index
 
     def compare_total_operations(self):
         """
@@ -129,6 +240,9 @@ class QueryInterface:
         min_time_ms : int, default=20
             Minimum time in milliseconds to classify an operation as long.
 
+        top_k : int, default=1
+            Number of longest operations to return per trace.
+
         type : str, default=None
             One of 'INSTRUCTION', 'DEDUP', 'LITERAL', 'CREATION'
             Filters by type of item.
@@ -147,32 +261,69 @@ class QueryInterface:
         -------
         pandas.DataFrame
             DataFrame containing traces that contain at least one long running operation.
+            Indexed by trace_id, with the top_k longest operations of each trace, longest first.
         """
         min_time_ms = kwargs.pop("min_time_ms", 20)
-        trace_item = (
-            self.database.trace_item.join(self.database.trace, on="trace_id")
-            .join(self.database.instruction, on="value_hash")
-            .join(self.database.op_info, on="op_code")
-        )
-        trace_item = self.select_operator(trace_item, **kwargs)
+        top_k = kwargs.pop("top_k", 1)
+        trace_item = self.select_operator(self.get_enriched_trace_item(), **kwargs)
         trace_item = trace_item[
             trace_item.execution_time > pd.Timedelta(min_time_ms, unit="ms")
         ]
 
-        def f(x):
-            d = {}
-            idx_max_time = x["execution_time"].idxmax()
-            d["execution_time"] = x["execution_time"][idx_max_time]
-            d["id"] = idx_max_time[1]
-            d["op_code"] = x["op_code"][idx_max_time]
-            return pd.Series(d, index=["id", "op_code", "execution_time"])
-
+        # stable sorts keep the first of equally long operations, like idxmax
         long_running_traces = (
             trace_item[["op_code", "execution_time"]]
-            .groupby("trace_id", group_keys=False)
-            .apply(f)
+            .reset_index(level="id")
+            .sort_values("execution_time", ascending=False, kind="stable")
+            .groupby("trace_id")
+            .head(top_k)
+            .sort_index(kind="stable")
+        )
+        return long_running_traces[["id", "op_code", "execution_time"]]
+
+    def execution_time_percentiles(
+        self, by="trace_id", percentiles=(0.5, 0.95, 0.99), **kwargs
+    ):
+        """
+        Percentiles of the execution time of operations per trace or per op_code.
+
+        Parameters
+        ----------
+        by : str or list of str, default="trace_id"
+            'trace_id', 'op_code' or both, to group the operations by.
+
+        percentiles : tuple of float, default=(0.5, 0.95, 0.99)
+            Percentiles to compute, between 0 and 1.
+
+        type : str, default=None
+            One of 'INSTRUCTION', 'DEDUP', 'LITERAL', 'CREATION'
+            Filters by type of item.
+            Should not be used with op_code, group or cp_type.
+
+        op_code : str, default=None
+            select only operations with this op_code. Only one of op_code, group and cp_type shall be set.
+
+        group : str, default=None
+            select only operations belonging to this group. Only one of op_code, group and cp_type shall be set.
+
+        cp_type : str, default=None
+            select only operations with this cp type. Only one of op_code, group and cp_type shall be set.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by the groups with one column per percentile, named like 'p95'.
+        """
+        trace_item = self.select_operator(self.get_enriched_trace_item(), **kwargs)
+        execution_time_percentiles = (
+            trace_item.groupby(by, observed=True)["execution_time"]
+            .quantile(list(percentiles))
+            .unstack()
         )
-        return long_running_traces
+        execution_time_percentiles.columns = [
+            f"p{percentile * 100:g}" for percentile in percentiles
+        ]
+        return execution_time_percentiles
 
     def compare_instruction_count(self, **kwargs):
         """
@@ -200,12 +351,7 @@ class QueryInterface:
         pandas.DataFrame
             DataFrame containing total item counts for each trace for the specified item type.
         """
-        trace_items = (
-            self.database.trace_item.join(self.database.trace, on="trace_id")
-            .join(self.database.instruction, on="value_hash")
-            .join(self.database.op_info, on="op_code")
-        )
-        trace_items = self.select_operator(trace_items, **kwargs)
+        trace_items = self.select_operator(self.get_enriched_trace_item(), **kwargs)
         operator_count = trace_items.groupby("trace_id").size().to_frame("item_count")
         return operator_count
 
@@ -219,10 +365,7 @@ class QueryInterface:
             DataFrame containing total time with execution types as columns and traces as index.
         """
         execution_types = (
-            self.database.trace_item.join(self.database.trace, on="trace_id")
-            .join(self.database.instruction, on="value_hash")[
-                ["execution_type", "execution_time"]
-            ]
+            self.get_enriched_trace_item()[["execution_type", "execution_time"]]
             .groupby(["trace_id", "execution_type"])
             .sum()
             .reset_index()
@@ -251,24 +394,47 @@ class QueryInterface:
         int
             The first unequal index (iloc! not label). Returns None if traces are equal.
         """
-        trace1 = self.database.trace_item.loc[id_trace1].reset_index()
-        trace2 = self.database.trace_item.loc[id_trace2].reset_index()
-        if compare_by == "lineage":
-            compare_column = "lineage_hash"
-        elif compare_by == "value":
-            compare_column = "value_hash"
-        else:
-            raise RuntimeError("compare_by must be either 'lineage' or 'value'")
-        min_len = min(len(trace1), len(trace2))
-        is_equal = list(
-            trace1[compare_column][:min_len] == trace2[compare_column][:min_len]
-        )
-        is_equal += [False] * (max(len(trace1), len(trace2)) - min_len)
-        try:
-            first_unequal_index = list(is_equal).index(False)
-        except ValueError:
+        index = self.get_prefix_hash_index(compare_by)
+        first_unequal_index = index.divergence([id_trace1], [id_trace2])[0]
+        if first_unequal_index < 0:
             return None
-        return first_unequal_index
+        return int(first_unequal_index)
+
+    def compare_traces_matrix(self, trace_ids=None, compare_by="lineage"):
+        """
+        Compare all pairs of traces and return the first unequal index of each pair.
+
+        Parameters
+        ----------
+        trace_ids : list of int, default=None
+            IDs of traces to be compared. All traces if None.
+        compare_by : str, optional, default="lineage"
+            Attribute to compare traces by, either 'lineage' or 'value'.
+
+        Raises
+        ------
+        RuntimeError
+            If compare_by is neither 'lineage' nor 'value'.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Matrix with trace ids as index and columns, containing the first unequal index
+            (iloc! not label) of each pair. <NA> if the traces are equal.
+        """
+        index = self.get_prefix_hash_index(compare_by)
+        if trace_ids is None:
+            trace_ids = index.trace_ids
+        trace_ids = np.asarray(trace_ids)
+        first_unequal_index = index.divergence(
+            np.repeat(trace_ids, len(trace_ids)), np.tile(trace_ids, len(trace_ids))
+        )
+        matrix = pd.DataFrame(
+            first_unequal_index.reshape(len(trace_ids), len(trace_ids)),
+            index=pd.Index(trace_ids, name="trace_id"),
+            columns=pd.Index(trace_ids, name="trace_id"),
+        ).astype("Int64")
+        return matrix.mask(matrix < 0)
 
     def compare_traces_by_date(self, date1, date2, compare_by="lineage"):
         """
@@ -301,3 +467,128 @@ class QueryInterface:
             raise RuntimeError("no trace found for date found!")
 
         return self.compare_traces_by_id(id1, id2, compare_by=compare_by)
+
+    def ancestors(self, value_hash, max_depth=None):
+        """
+        Find all items that an item was computed from, directly or indirectly.
+
+        Parameters
+        ----------
+        value_hash : str
+            Value hash of the item.
+        max_depth : int, default=None
+            Maximum number of lineage steps to follow. Unlimited if None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by value_hash of the ancestors, with the number of
+            lineage steps to the item in column 'distance', closest first.
+        """
+        return self.get_lineage_graph().ancestors(value_hash, max_depth)
+
+    def descendants(self, value_hash, max_depth=None):
+        """
+        Find all items that were computed from an item, directly or indirectly.
+
+        Parameters
+        ----------
+        value_hash : str
+            Value hash of the item.
+        max_depth : int, default=None
+            Maximum number of lineage steps to follow. Unlimited if None.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by value_hash of the descendants, with the number of
+            lineage steps from the item in column 'distance', closest first.
+        """
+        return self.get_lineage_graph().descendants(value_hash, max_depth)
+
+    def subgraph_between(self, from_value_hash, to_value_hash):
+        """
+        Find the lineage connecting two items.
+
+        Parameters
+        ----------
+        from_value_hash : str
+            Value hash of the item the paths start at.
+        to_value_hash : str
+            Value hash of the item the paths end at.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows of the lineage table that are on a path from the first to the second item.
+            Empty if the second item was not computed from the first.
+        """
+        return self.get_lineage_graph().subgraph_between(
+            from_value_hash, to_value_hash
+        )
+
+    def critical_path(self, trace_id=None):
+        """
+        Find the longest chain of dependent items of a trace, weighted by execution time,
+        and the slack of every item.
+
+        Parameters
+        ----------
+        trace_id : int, default=None
+            ID of the trace to analyse. If None, all traces are analysed at once.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by trace_id and id with columns
+            'execution_time',
+            'earliest_finish' (end time of the longest chain ending at the item),
+            'slack' (how much longer the item could take without delaying the trace) and
+            'critical' (True for the items on the critical path).
+            The critical path of a trace is df[df.critical], its length the maximum of 'earliest_finish'.
+        """
+        trace_item = self.database.trace_item
+        if trace_id is not None:
+            trace_item = trace_item.loc[[trace_id]]
+        return critical_path(trace_item, self.database.lineage)
+
+    def expand_dedup(self, value_hash):
+        """
+        Find the patch a dedup item stands for, with its inputs bound.
+
+        The items of a patch are loaded once from the .dedup file as a template
+        into the patch_item table.
+        Its placeholder items IN#k are bound to the k-th input of the dedup item.
+
+        Parameters
+        ----------
+        value_hash : str or int
+            Value hash of the dedup item.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Items of the patch template indexed by (patch_name, id), with the value
+            hash of the bound input in column 'bound_value_hash' for placeholder items
+            and NA otherwise. Empty if the .dedup file of the patch was not loaded.
+        """
+        dedup = self.database.dedup.loc[value_hash]
+        patch_name = dedup.dedup_name[len("dedup_") :]
+
+        patch_item = self.database.patch_item
+        template = patch_item[
+            patch_item.index.get_level_values("patch_name") == patch_name
+        ]
+
+        dedup_in = self.database.creation.dedup_in.reindex(template.value_hash)
+        input_hashes = np.asarray(dedup.input_hashes)
+        # bind by position without going through float, which loses int64 hashes
+        is_placeholder = (dedup_in.notna() & (dedup_in < len(input_hashes))).to_numpy()
+        positions = dedup_in.to_numpy()[is_placeholder].astype(np.int64)
+        if self.database.metadata["hash_format"] == "int64":
+            bound_dtype = "Int64"
+        else:
+            bound_dtype = "string"
+        bound = pd.array([pd.NA] * len(template), dtype=bound_dtype)
+        bound[is_placeholder] = input_hashes[positions]
+        return template.assign(bound_value_hash=bound)
@@ -0,0 +1,718 @@
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
+from LinageTraceDatabase import LineageTraceDatabase
+
+
+class SqlTraceDatabase:
+    """
+    The tables of LineageTraceDatabase stored in an SQLite database file.
+
+    Tables and columns are the same as in LineageTraceDatabase, index columns are
+    stored as ordinary columns. Content tables use their index as primary key,
+    so every value hash is stored once. Rows of trace_item are stored in trace order.
+    Timedeltas and dates are stored as integer nanoseconds,
+    columns holding python objects as json.
+
+    Attributes
+    ----------
+    path : str
+        Path of the database file.
+    connection : sqlite3.Connection
+        Connection to the database file.
+    metadata : dict
+        Settings of the stored database, see LineageTraceDatabase.
+    """
+
+    # tables with their index as primary key, all others except trace_item too
+    tables = dict(LineageTraceDatabase.tables) | {"op_info": ("op_code", True)}
+
+    # indexes besides the primary keys, as (table, columns)
+    indexes = [
+        ("trace_item", ["trace_id", "id"]),
+        ("trace_item", ["value_hash"]),
+        ("trace_value", ["value_hash"]),
+        ("lineage", ["is_input_for_value_hash"]),
+        ("instruction", ["op_code"]),
+    ]
+
+    def __init__(self, path, hash_format="hex", hash_backend="sha256"):
+        """
+        Parameters
+        ----------
+        path : str
+            Database file. Created with empty tables if it does not exist.
+        hash_format, hash_backend : str
+            Settings of a new database, see LineageTraceDatabase.
+            An existing database keeps the settings it was created with.
+        """
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        stored = dict(self.connection.execute("SELECT key, value FROM metadata"))
+        if stored:
+            self.metadata = {key: json.loads(value) for key, value in stored.items()}
+        else:
+            self.metadata = {"hash_format": hash_format, "hash_backend": hash_backend}
+            self.write_metadata()
+        self.schema_database = LineageTraceDatabase(**self.settings())
+        # first trace id of the current bulk load, see begin_load
+        self.id_offset = None
+        self.create_tables()
+
+    def settings(self):
+        return {
+            key: self.metadata[key] for key in LineageTraceDatabase.default_settings
+        }
+
+    def write_metadata(self):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in self.metadata.items()],
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def schema(self, table):
+        """
+        Schema of a table as in LineageTraceDatabase, including the index columns.
+        """
+        if table == "op_info":
+            return dict(LineageTraceDatabase.op_info_schema)
+        return self.schema_database.schema(table)
+
+    @staticmethod
+    def sql_type(dtype):
+        if dtype in ["string", "object"] or isinstance(dtype, pd.CategoricalDtype):
+            return "TEXT"
+        # not INTEGER, which makes a primary key an alias of the rowid,
+        # so the rows would be ordered by key instead of insertion
+        return "INT"
+
+    def create_tables(self):
+        with self.connection:
+            for table, (index, deduplicate) in self.tables.items():
+                columns = [
+                    f'"{column}" {self.sql_type(dtype)}'
+                    for column, dtype in self.schema(table).items()
+                ]
+                if deduplicate or table == "trace":
+                    index = index if isinstance(index, list) else [index]
+                    columns.append(
+                        "PRIMARY KEY (" + ", ".join(f'"{c}"' for c in index) + ")"
+                    )
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})"
+                )
+
+    def index_names(self):
+        return [table + "_" + "_".join(columns) for table, columns in self.indexes]
+
+    def create_indexes(self):
+        """
+        Create the secondary indexes used by the queries.
+        """
+        with self.connection:
+            for name, (table, columns) in zip(self.index_names(), self.indexes):
+                self.connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+                    "(" + ", ".join(columns) + ")"
+                )
+
+    def drop_indexes(self):
+        with self.connection:
+            for name in self.index_names():
+                self.connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+    def frame_to_rows(self, table, df):
+        """
+        Rows of a dataframe of table as tuples of python values, in schema order.
+        """
+        schema = self.schema(table)
+        df = df.reset_index()
+        columns = []
+        for column, dtype in schema.items():
+            values = df[column]
+            missing = values.isna().to_numpy()
+            if dtype == "object":
+                values = values.map(json.dumps, na_action="ignore")
+            elif dtype in ["timedelta64[ns]", "datetime64[ns, UTC]"]:
+                # nanoseconds, NaT is replaced by None below
+                values = values.array.asi8
+            values = np.asarray(values, dtype=object)
+            values[missing] = None
+            columns.append(values)
+        return list(zip(*columns))
+
+    def insert_rows(self, table, rows):
+        """
+        Insert rows into a table. Rows whose primary key already exists are skipped,
+        so the first row of every key is kept.
+        """
+        placeholders = ", ".join(["?"] * len(self.schema(table)))
+        self.connection.executemany(
+            f"INSERT OR IGNORE INTO {table} VALUES ({placeholders})", rows
+        )
+
+    def begin_load(self):
+        """
+        Prepare a bulk load with write_frame.
+        Secondary indexes are dropped until end_load, so inserts only maintain
+        the primary keys. New trace ids follow the traces already stored.
+        """
+        self.drop_indexes()
+        self.id_offset = self.next_trace_id()
+
+    def write_frame(self, table, df):
+        """
+        Insert the rows of a dataframe of table in one transaction, see begin_load.
+        Rows whose primary key is already stored are skipped.
+        """
+        if table == "trace":
+            df = df.set_axis(df.index + self.id_offset)
+        elif table in LineageTraceDatabase.trace_id_tables:
+            df = df.set_axis(
+                df.index.set_levels(
+                    df.index.levels[0] + self.id_offset, level="trace_id"
+                )
+            )
+        with self.connection:
+            self.insert_rows(table, self.frame_to_rows(table, df))
+
+    def end_load(self):
+        """
+        Finish a bulk load by creating the secondary indexes.
+        """
+        self.create_indexes()
+        self.id_offset = None
+
+    def write(self, database):
+        """
+        Append all tables of a database converted to pandas.
+        Trace ids are shifted to follow the traces already stored.
+
+        Parameters
+        ----------
+        database : LineageTraceDatabase
+            Database with tables as pandas dataframes and the same settings.
+        """
+        if database.settings() != self.settings():
+            raise RuntimeError("can not write a database with different settings")
+        self.begin_load()
+        for table in self.tables:
+            self.write_frame(table, getattr(database, table))
+        self.end_load()
+
+    def next_trace_id(self):
+        (max_id,) = self.connection.execute("SELECT MAX(id) FROM trace").fetchone()
+        return 0 if max_id is None else max_id + 1
+
+    def query(self, sql, params=()):
+        """
+        Run a query and return the result as DataFrame.
+        """
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def rows_to_frame(self, table, df):
+        """
+        Convert rows read from a table to the dtypes and index of LineageTraceDatabase.
+        """
+        schema = self.schema(table)
+        for column, dtype in schema.items():
+            if column not in df:
+                continue
+            if dtype == "object":
+                df[column] = df[column].map(json.loads, na_action="ignore")
+            elif dtype == "timedelta64[ns]":
+                df[column] = pd.to_timedelta(df[column], unit="ns")
+            elif dtype == "datetime64[ns, UTC]":
+                df[column] = pd.to_datetime(df[column], unit="ns", utc=True)
+            elif dtype == "boolean":
+                df[column] = df[column].astype("boolean")
+        df = df.astype({c: d for c, d in schema.items() if c in df and d != "object"})
+        index = self.tables[table][0]
+        if isinstance(index, list):
+            df.index = pd.MultiIndex.from_frame(df[index])
+        else:
+            df.index = pd.Index(df[index])
+        return df.drop(columns=index)
+
+    def read_table(self, table, where="", params=()):
+        """
+        Read a table, or the rows matching a condition, as dataframe.
+
+        Parameters
+        ----------
+        table : str
+            Name of the table.
+        where : str, default=""
+            SQL condition to select rows, with ? placeholders for params.
+        params : tuple, default=()
+            Values of the placeholders.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Rows in the same format as the table of LineageTraceDatabase.
+        """
+        sql = f"SELECT * FROM {table}"
+        if where:
+            sql += " WHERE " + where
+        return self.rows_to_frame(table, self.query(sql + " ORDER BY rowid", params))
+
+    def to_pandas(self):
+        """
+        Read all tables into a LineageTraceDatabase.
+        """
+        database = LineageTraceDatabase(**self.settings())
+        for table in self.tables:
+            setattr(database, table, self.read_table(table))
+        database.metadata = self.metadata | database.metadata
+        return database
+
+
+class SqlQueryInterface:
+    """
+    Queries of QueryInterface that run as SQL in an SqlTraceDatabase.
+
+    Filters like op_code, group, cp_type, type and min_time_ms are part of the SQL
+    query, so only the result is loaded into memory.
+    Queries that need whole tables, like critical_path, need a QueryInterface
+    of SqlTraceDatabase.to_pandas().
+
+    Methods
+    -------
+    select_operator(type=None, op_code=None, group=None, cp_type=None)
+        Returns trace items with their instruction and op_info.
+
+    compare_total_operations()
+        Compares the total operations in the traces.
+
+    find_trace_long_operation(min_time_ms = 20)
+        Finds long operations within the traces with a minimum execution time.
+
+    execution_time_percentiles(by="trace_id", percentiles=(0.5, 0.95, 0.99))
+        Percentiles of the execution time per trace or op_code.
+
+    compare_instruction_count()
+        Compare instruction count in traces.
+
+    list_execution_types()
+        List total execution duration of different execution types present in trace items.
+
+    compare_traces_by_id(id_trace1, id_trace2, compare_by="lineage")
+        Compare two different traces by id.
+
+    compare_traces_by_date(date1, date2, compare_by="lineage")
+        Compare two different traces by their dates.
+
+    ancestors(value_hash, max_depth=None)
+        Find all items that an item was computed from.
+
+    descendants(value_hash, max_depth=None)
+        Find all items that were computed from an item.
+    """
+
+    enriched_trace_item = """
+        SELECT t.rowid AS position, t.trace_id, t.id, t.type, t.execution_time,
+            i.op_code, i.execution_type, o."group", o.cp_type
+        FROM trace_item t
+        LEFT JOIN instruction i ON i.value_hash = t.value_hash
+        LEFT JOIN op_info o ON o.op_code = i.op_code
+    """
+
+    def __init__(self, database):
+        """
+        Parameters
+        ----------
+        database : SqlTraceDatabase
+            The database containing all traces
+        """
+        self.database = database
+
+    def operator_filter(
+        self, type=None, op_code=None, group=None, cp_type=None, min_time_ms=None
+    ):
+        """
+        SQL condition and parameters for the filters of select_operator,
+        on the columns of enriched_trace_item.
+        """
+        if type is not None:
+            if op_code is not None or group is not None or cp_type is not None:
+                raise RuntimeError("multiple operator selectors not possible")
+            if type not in ["INSTRUCTION", "DEDUP", "LITERAL", "CREATION"]:
+                raise RuntimeError("invalid type")
+        if (op_code and group) or (op_code and cp_type) or (group and cp_type):
+            raise RuntimeError("multiple operator selectors not possible")
+        conditions = []
+        params = []
+        for column, value in [
+            ("t.type", type),
+            ("i.op_code", op_code),
+            ('o."group"', group),
+            ("o.cp_type", cp_type),
+        ]:
+            if value is not None:
+                conditions.append(column + " = ?")
+                params.append(value)
+        if min_time_ms is not None:
+            conditions.append("t.execution_time > ?")
+            params.append(pd.Timedelta(min_time_ms, unit="ms").value)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def select_operator(self, type=None, op_code=None, group=None, cp_type=None):
+        """
+        Select trace items by type, op_code, group or cp_type.
+
+        Parameters
+        ----------
+        type, op_code, group, cp_type : str, default=None
+            Selectors as in QueryInterface.select_operator.
+
+        Raises
+        ------
+        RuntimeError
+            If multiple operator selectors are provided.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by trace_id and id with columns 'type', 'execution_time',
+            'op_code', 'execution_type', 'group' and 'cp_type'.
+        """
+        where, params = self.operator_filter(type, op_code, group, cp_type)
+        df = self.database.query(
+            self.enriched_trace_item + where + " ORDER BY t.rowid", params
+        )
+        schema = self.database.schema("trace_item")
+        df = df.astype(
+            {
+                "type": schema["type"],
+                "execution_time": "int64",
+                "op_code": "string",
+                "execution_type": self.database.schema("instruction")["execution_type"],
+                "group": "string",
+                "cp_type": "string",
+            }
+        )
+        df["execution_time"] = pd.to_timedelta(df.execution_time, unit="ns")
+        return df.set_index(["trace_id", "id"]).drop(columns="position")
+
+    def compare_total_operations(self):
+        """
+        Compare the total operations per trace.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Number of trace items in column 'count' and the date, file, file_size
+            and file_hash of each trace, indexed by trace_id, most items first.
+        """
+        df = self.database.query(
+            """
+            SELECT c.trace_id, c.count, t.date, t.file, t.file_size, t.file_hash
+            FROM (SELECT trace_id, COUNT(*) AS count FROM trace_item GROUP BY trace_id) c
+            JOIN trace t ON t.id = c.trace_id
+            ORDER BY c.count DESC, c.trace_id
+            """
+        )
+        df["date"] = pd.to_datetime(df.date, unit="ns", utc=True)
+        schema = self.database.schema("trace")
+        df = df.astype({column: schema[column] for column in df if column in schema})
+        return df.set_index("trace_id")
+
+    def find_trace_long_operation(self, **kwargs):
+        """
+        Find traces with long operations, see QueryInterface.find_trace_long_operation.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Indexed by trace_id, with the top_k longest operations of each trace,
+            longest first, in columns 'id', 'op_code' and 'execution_time'.
+        """
+        min_time_ms = kwargs.pop("min_time_ms", 20)
+        top_k = kwargs.pop("top_k", 1)
+        where, params = self.operator_filter(min_time_ms=min_time_ms, **kwargs)
+        df = self.database.query(
+            f"""
+            SELECT trace_id, id, op_code, execution_time FROM (
+                SELECT t.trace_id, t.id, i.op_code, t.execution_time,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY t.trace_id ORDER BY t.execution_time DESC, t.rowid
+                    ) AS rank
+                FROM trace_item t
+                LEFT JOIN instruction i ON i.value_hash = t.value_hash
+                LEFT JOIN op_info o ON o.op_code = i.op_code
+                {where}
+            )
+            WHERE rank <= ?
+            ORDER BY trace_id, rank
+            """,
+            params + [top_k],
+        )
+        df["op_code"] = df.op_code.astype("string")
+        df["execution_time"] = pd.to_timedelta(df.execution_time, unit="ns")
+        return df.set_index("trace_id")
+
+    def execution_time_percentiles(
+        self, by="trace_id", percentiles=(0.5, 0.95, 0.99), **kwargs
+    ):
+        """
+        Percentiles of the execution time per trace or op_code, linearly interpolated
+        like pandas. See QueryInterface.execution_time_percentiles.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by the groups with one column per percentile, named like 'p95'.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        if not set(by) <= {"trace_id", "op_code"}:
+            raise RuntimeError("by must be 'trace_id', 'op_code' or both")
+        where, params = self.operator_filter(**kwargs)
+        if "op_code" in by:
+            where += (" AND" if where else " WHERE") + " i.op_code IS NOT NULL"
+        columns = ", ".join(by)
+        selected = ", ".join(
+            ("t." if column == "trace_id" else "i.") + column for column in by
+        )
+        # also numpy scalars, whose repr is no SQL literal
+        percentiles = [float(percentile) for percentile in percentiles]
+        if not all(0 <= percentile <= 1 for percentile in percentiles):
+            raise RuntimeError("percentiles must be between 0 and 1")
+        names = [f"p{percentile * 100:g}" for percentile in percentiles]
+        interpolations = []
+        for percentile, name in zip(percentiles, names):
+            position = f"({percentile!r} * (n - 1))"
+            lower = f"CAST({position} AS INTEGER)"
+            fraction = f"({position} - {lower})"
+            interpolations.append(
+                f"SUM(CASE WHEN rank = {lower} THEN value * (1 - {fraction}) "
+                f"WHEN rank = {lower} + 1 THEN value * {fraction} ELSE 0 END) "
+                f'AS "{name}"'
+            )
+        df = self.database.query(
+            f"""
+            SELECT {columns}, {", ".join(interpolations)} FROM (
+                SELECT {selected}, t.execution_time AS value,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY {selected} ORDER BY t.execution_time
+                    ) - 1 AS rank,
+                    COUNT(*) OVER (PARTITION BY {selected}) AS n
+                FROM trace_item t
+                LEFT JOIN instruction i ON i.value_hash = t.value_hash
+                LEFT JOIN op_info o ON o.op_code = i.op_code
+                {where}
+            )
+            GROUP BY {columns}
+            ORDER BY {columns}
+            """,
+            params,
+        )
+        for name in names:
+            df[name] = pd.to_timedelta(df[name].round(), unit="ns")
+        if "op_code" in by:
+            df["op_code"] = df.op_code.astype("string")
+        return df.set_index(by)
+
+    def compare_instruction_count(self, **kwargs):
+        """
+        Compare instruction count in each trace, see QueryInterface.compare_instruction_count.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame containing total item counts for each trace for the specified item type.
+        """
+        where, params = self.operator_filter(**kwargs)
+        return self.database.query(
+            f"""
+            SELECT t.trace_id, COUNT(*) AS item_count
+            FROM trace_item t
+            LEFT JOIN instruction i ON i.value_hash = t.value_hash
+            LEFT JOIN op_info o ON o.op_code = i.op_code
+            {where}
+            GROUP BY t.trace_id
+            ORDER BY t.trace_id
+            """,
+            params,
+        ).set_index("trace_id")
+
+    def list_execution_types(self):
+        """
+        Show total execution time per execution type and trace.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame containing total time with execution types as columns and traces as index.
+        """
+        df = self.database.query(
+            """
+            SELECT t.trace_id, i.execution_type, SUM(t.execution_time) AS execution_time
+            FROM trace_item t
+            JOIN instruction i ON i.value_hash = t.value_hash
+            GROUP BY t.trace_id, i.execution_type
+            """
+        )
+        df["execution_time"] = pd.to_timedelta(df.execution_time, unit="ns")
+        df["execution_type"] = df.execution_type.astype(
+            self.database.schema("instruction")["execution_type"]
+        )
+        # columns in the order of the categories, like the groupby in QueryInterface
+        return df.pivot(
+            index="trace_id", columns="execution_type", values="execution_time"
+        ).sort_index(axis=1)
+
+    def compare_traces_by_id(self, id_trace1, id_trace2, compare_by="lineage"):
+        """
+        Compare two traces by their ids and return unequal index.
+
+        Parameters
+        ----------
+        id_trace1, id_trace2 : int
+            IDs of traces to be compared.
+        compare_by : str, optional, default="lineage"
+            Attribute to compare traces by, either 'lineage' or 'value'.
+
+        Raises
+        ------
+        RuntimeError
+            If compare_by is neither 'lineage' nor 'value'.
+
+        Returns
+        -------
+        int
+            The first unequal index (iloc! not label). Returns None if traces are equal.
+        """
+        if compare_by == "lineage":
+            compare_column = "lineage_hash"
+        elif compare_by == "value":
+            compare_column = "value_hash"
+        else:
+            raise RuntimeError("compare_by must be either 'lineage' or 'value'")
+        positions = f"""
+            SELECT {compare_column} AS hash,
+                ROW_NUMBER() OVER (ORDER BY rowid) - 1 AS position
+            FROM trace_item WHERE trace_id = ?
+        """
+        first_unequal, length1, length2 = self.database.connection.execute(
+            f"""
+            SELECT
+                (SELECT MIN(a.position) FROM ({positions}) a
+                    JOIN ({positions}) b ON a.position = b.position
+                    WHERE a.hash <> b.hash),
+                (SELECT COUNT(*) FROM trace_item WHERE trace_id = ?),
+                (SELECT COUNT(*) FROM trace_item WHERE trace_id = ?)
+            """,
+            (id_trace1, id_trace2, id_trace1, id_trace2),
+        ).fetchone()
+        if first_unequal is not None:
+            return first_unequal
+        if length1 != length2:
+            return min(length1, length2)
+        return None
+
+    def compare_traces_by_date(self, date1, date2, compare_by="lineage"):
+        """
+        Compare two traces by their dates and return unequal index.
+
+        Raises
+        ------
+        RuntimeError
+            If compare_by is neither 'lineage' nor 'value',
+            or no trace is found with date1 or date2.
+
+        Returns
+        ------
+        int
+            The first unequal index. Returns None if traces are equal.
+        """
+        ids = []
+        for date in [date1, date2]:
+            row = self.database.connection.execute(
+                "SELECT id FROM trace WHERE date = ? ORDER BY id LIMIT 1",
+                (pd.Timestamp(date).value,),
+            ).fetchone()
+            if row is None:
+                raise RuntimeError("no trace found for date found!")
+            ids.append(row[0])
+        return self.compare_traces_by_id(*ids, compare_by=compare_by)
+
+    def reachable(self, value_hash, from_column, to_column, max_depth=None):
+        """
+        Breadth first search over the lineage table, one statement per level
+        like LineageGraph.bfs. Every item is inserted once with its shortest
+        distance, so the work grows with the reached items, not with the paths.
+        """
+        if isinstance(value_hash, np.generic):
+            # int64 hashes, sqlite3 only binds python ints
+            value_hash = value_hash.item()
+        connection = self.database.connection
+        with connection:
+            connection.execute("DROP TABLE IF EXISTS temp.reached")
+            connection.execute(
+                "CREATE TEMP TABLE reached (value_hash PRIMARY KEY, distance INT)"
+            )
+            connection.execute("INSERT INTO temp.reached VALUES (?, 0)", (value_hash,))
+            depth = 0
+            while max_depth is None or depth < max_depth:
+                cursor = connection.execute(
+                    f"""
+                    INSERT OR IGNORE INTO temp.reached
+                    SELECT l.{to_column}, ? FROM lineage l
+                    JOIN temp.reached r ON l.{from_column} = r.value_hash
+                    WHERE r.distance = ?
+                    """,
+                    (depth + 1, depth),
+                )
+                if cursor.rowcount == 0:
+                    break
+                depth += 1
+        df = self.database.query(
+            """
+            SELECT value_hash, distance FROM temp.reached WHERE distance > 0
+            ORDER BY distance, value_hash
+            """
+        )
+        with connection:
+            connection.execute("DROP TABLE temp.reached")
+        df["value_hash"] = df.value_hash.astype(
+            self.database.schema("lineage")["value_hash"]
+        )
+        return df.set_index("value_hash")
+
+    def ancestors(self, value_hash, max_depth=None):
+        """
+        Find all items that an item was computed from, directly or indirectly.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by value_hash of the ancestors, with the number of
+            lineage steps to the item in column 'distance', closest first.
+        """
+        return self.reachable(
+            value_hash, "is_input_for_value_hash", "value_hash", max_depth
+        )
+
+    def descendants(self, value_hash, max_depth=None):
+        """
+        Find all items that were computed from an item, directly or indirectly.
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame indexed by value_hash of the descendants, with the number of
+            lineage steps from the item in column 'distance', closest first.
+        """
+        return self.reachable(
+            value_hash, "value_hash", "is_input_for_value_hash", max_depth
+        )
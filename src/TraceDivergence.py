@@ -0,0 +1,110 @@
+import numpy as np
+from ItemLoader import hashes_to_int64
+
+
+class PrefixHashIndex:
+    """
+    Rolling prefix hashes of all traces for one hash column of trace_item.
+
+    The prefix hash of a trace at position i is a polynomial hash modulo 2^64
+    of the first i + 1 hashes of the column. Two traces are equal up to position i
+    if (with very high probability) their prefix hashes at i are equal,
+    so the point where two traces diverge can be found by binary search.
+
+    Attributes
+    ----------
+    trace_item : pandas.DataFrame
+        The trace_item table the index was built from.
+    trace_ids : numpy.ndarray
+        Sorted ids of all traces.
+    starts, lengths : numpy.ndarray
+        Start offset in prefix and number of items of each trace.
+    prefix : numpy.ndarray
+        Prefix hashes of all traces, concatenated.
+    """
+
+    # odd, so all powers are distinct modulo 2^64
+    base = np.uint64(0x9E3779B97F4A7C15)
+
+    def __init__(self, trace_item, column):
+        """
+        Parameters
+        ----------
+        trace_item : pandas.DataFrame
+            Trace items indexed by (trace_id, id).
+        column : str
+            Hash column to compare, either 'lineage_hash' or 'value_hash'.
+        """
+        self.trace_item = trace_item
+        keys = trace_item[column]
+        if keys.dtype == "int64":
+            keys = keys.to_numpy()
+        else:
+            keys = hashes_to_int64(keys)
+        keys = keys.view(np.uint64)
+
+        trace_ids = trace_item.index.get_level_values("trace_id").to_numpy()
+        order = np.argsort(trace_ids, kind="stable")
+        keys = keys[order]
+        self.trace_ids, self.starts, self.lengths = np.unique(
+            trace_ids[order], return_index=True, return_counts=True
+        )
+
+        positions = np.arange(len(keys)) - np.repeat(self.starts, self.lengths)
+        max_length = self.lengths.max() if len(self.lengths) > 0 else 0
+        powers = np.ones(max_length, dtype=np.uint64)
+        powers[1:] = np.cumprod(np.full(max(max_length - 1, 0), self.base, dtype=np.uint64))
+        cumulative = np.cumsum(keys * powers[positions], dtype=np.uint64)
+        before_start = np.zeros(len(self.starts), dtype=np.uint64)
+        before_start[1:] = cumulative[self.starts[1:] - 1]
+        self.prefix = cumulative - np.repeat(before_start, self.lengths)
+
+    def trace_positions(self, trace_ids):
+        trace_ids = np.asarray(trace_ids)
+        if len(self.trace_ids) == 0:
+            if trace_ids.size > 0:
+                raise KeyError("trace id not found")
+            return np.zeros(trace_ids.shape, dtype=np.int64)
+        positions = np.searchsorted(self.trace_ids, trace_ids)
+        positions = np.minimum(positions, len(self.trace_ids) - 1)
+        if len(positions) > 0 and (self.trace_ids[positions] != trace_ids).any():
+            raise KeyError("trace id not found")
+        return positions
+
+    def divergence(self, trace_ids1, trace_ids2):
+        """
+        First position where two traces differ, for many pairs of traces at once.
+
+        Parameters
+        ----------
+        trace_ids1, trace_ids2 : array-like of int
+            IDs of the traces to compare pairwise.
+
+        Returns
+        -------
+        numpy.ndarray
+            First unequal position of each pair, -1 if both traces are equal.
+            If one trace is a prefix of the other, this is the length of the shorter one.
+        """
+        positions1 = self.trace_positions(trace_ids1)
+        positions2 = self.trace_positions(trace_ids2)
+        starts1 = self.starts[positions1]
+        starts2 = self.starts[positions2]
+        min_lengths = np.minimum(self.lengths[positions1], self.lengths[positions2])
+
+        # prefixes are equal before low, the first difference is before high or there is none
+        low = np.zeros(len(min_lengths), dtype=np.int64)
+        high = min_lengths.astype(np.int64)
+        searching = low < high
+        while searching.any():
+            middle = (low + high) // 2
+            equal = (
+                self.prefix[np.where(searching, starts1 + middle, 0)]
+                == self.prefix[np.where(searching, starts2 + middle, 0)]
+            )
+            low = np.where(searching & equal, middle + 1, low)
+            high = np.where(searching & ~equal, middle, high)
+            searching = low < high
+
+        same_length = self.lengths[positions1] == self.lengths[positions2]
+        return np.where((low == min_lengths) & same_length, -1, low)
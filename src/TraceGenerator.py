@@ -0,0 +1,331 @@
+"""
+Generator of synthetic lineage traces for scale testing.
+
+The generated .lineage and .lineage.dedup files are accepted by the grammar in
+LineageItemGrammar. Line count, mix of item types, fan-in of instructions, op_code
+frequencies and a prefix shared between traces can be set.
+
+    python src/TraceGenerator.py synthetic --traces 4 --lines 1000000
+"""
+import argparse
+import collections
+import pathlib
+import random
+
+import pandas as pd
+
+from TraceLoader import parse_linage_rows
+from LinageTraceDatabase import LineageTraceDatabase
+
+default_item_mix = {"L": 0.15, "C": 0.03, "I": 0.8, "D": 0.02}
+
+literal_types = [
+    ("INT64", "true"),
+    ("INT64", "false"),
+    ("FP64", "true"),
+    ("BOOLEAN", "true"),
+    ("STRING", "true"),
+]
+
+
+def read_op_codes(op_info_path=LineageTraceDatabase.op_info_path):
+    """
+    All op codes listed in op_info.csv.
+    """
+    op_info = pd.read_csv(op_info_path, sep=";", dtype={"op_code": "string"})
+    return op_info.op_code.tolist()
+
+
+def op_code_frequencies(trace_files, op_info_path=LineageTraceDatabase.op_info_path):
+    """
+    Relative frequency of the op codes of op_info.csv in existing traces.
+    Can be passed as op_code_weights to TraceGenerator.
+    """
+    op_codes = set(read_op_codes(op_info_path))
+    counts = collections.Counter()
+    for path_to_file in trace_files:
+        for row in parse_linage_rows(path_to_file):
+            if row.get("type") == "I" and row["representation"]["op_code"] in op_codes:
+                counts[row["representation"]["op_code"]] += 1
+    total = sum(counts.values())
+    return {op_code: count / total for op_code, count in counts.items()}
+
+
+class TraceGenerator:
+    """
+    Writes synthetic lineage traces.
+
+    Items are numbered consecutively. The inputs of instructions and dedup items
+    are drawn from the last `window` items, which gives long chains of
+    dependencies like in real traces.
+
+    Attributes
+    ----------
+    patches : dict of str to int
+        Name and number of inputs of every dedup patch.
+    """
+
+    def __init__(
+        self,
+        item_mix=None,
+        fan_in=(1, 3),
+        op_code_weights=None,
+        op_info_path=LineageTraceDatabase.op_info_path,
+        num_patches=4,
+        patch_lines=20,
+        window=50,
+        seed=0,
+    ):
+        """
+        Parameters
+        ----------
+        item_mix : dict of str to float, default=None
+            Relative frequency of the item types 'L', 'C', 'I' and 'D'.
+            default_item_mix if None.
+        fan_in : tuple of int, default=(1, 3)
+            Minimum and maximum number of inputs of an instruction or dedup item.
+        op_code_weights : dict of str to float, default=None
+            Relative frequency of each op code, see op_code_frequencies.
+            All op codes of op_info.csv are equally likely if None.
+        op_info_path : str, default=LineageTraceDatabase.op_info_path
+            op_info.csv to read the op codes from if op_code_weights is None.
+        num_patches : int, default=4
+            Number of dedup patches that dedup items can refer to.
+        patch_lines : int, default=20
+            Number of lines of each dedup patch.
+        window : int, default=50
+            Inputs are drawn from this many previous items.
+        seed : int, default=0
+            Seed of the random generator. Equal seeds give equal traces.
+        """
+        self.item_mix = default_item_mix if item_mix is None else item_mix
+        if set(self.item_mix) - set("LCID"):
+            raise RuntimeError("item_mix keys must be 'L', 'C', 'I' or 'D'")
+        if fan_in[0] < 1 or fan_in[1] < fan_in[0]:
+            raise RuntimeError("fan_in must be a (min, max) pair with 1 <= min <= max")
+        if op_code_weights is None:
+            op_code_weights = dict.fromkeys(read_op_codes(op_info_path), 1)
+        self.op_codes = list(op_code_weights)
+        self.op_code_weights = list(op_code_weights.values())
+        self.fan_in = fan_in
+        self.window = window
+        self.patch_lines = patch_lines
+        self.seed = seed
+        self.random = random.Random(seed)
+        if self.item_mix.get("D", 0) == 0:
+            num_patches = 0
+        self.patches = {
+            f"X_SB{number}_0": self.random.randint(fan_in[0], fan_in[1])
+            for number in range(num_patches)
+        }
+
+    def literal(self):
+        value_type, flag = self.random.choice(literal_types)
+        if value_type == "INT64":
+            value = str(self.random.randint(0, 10000))
+        elif value_type == "FP64":
+            value = str(round(self.random.uniform(-100, 100), 3))
+        elif value_type == "BOOLEAN":
+            value = self.random.choice(["true", "false"])
+        else:
+            value = "str" + str(self.random.randint(0, 100))
+        return f"{value}·SCALAR·{value_type}·{flag}"
+
+    def creation(self):
+        rows = self.random.randint(1, 10000)
+        cols = self.random.randint(1, 1000)
+        creation_method = self.random.choice(["rand", "createvar", "seq"])
+        if creation_method == "rand":
+            return (
+                f"CP°rand°{rows}·SCALAR·INT64·true°{cols}·SCALAR·INT64·true°1000°0°20°"
+                f"1.0°{self.random.randint(0, 1000)}°uniform°1.0°8°xxx·MATRIX·FP64"
+            )
+        if creation_method == "createvar":
+            return (
+                f"CP°createvar°pREADxxx°in/X{self.random.randint(0, 100)}°false°MATRIX°"
+                f"text°{rows}°{cols}°-1°-1°copy"
+            )
+        return (
+            f"CP°seq°{rows}°1°1000°1·SCALAR·INT64·true°{rows}·SCALAR·INT64·true°"
+            "1·SCALAR·INT64·true°xxx·MATRIX·FP64"
+        )
+
+    def inputs(self, next_id, num_inputs, first_id=0):
+        first = max(first_id, next_id - self.window)
+        return "".join(
+            f" ({self.random.randrange(first, next_id)})" for _ in range(num_inputs)
+        )
+
+    def instruction(self, next_id, first_id=0):
+        op_code = self.random.choices(self.op_codes, self.op_code_weights)[0]
+        num_inputs = self.random.randint(self.fan_in[0], self.fan_in[1])
+        return op_code + self.inputs(next_id, num_inputs, first_id)
+
+    def lines(self, num_lines, first_id=0):
+        """
+        Generate the lines of a trace.
+
+        Parameters
+        ----------
+        num_lines : int
+            Number of lines.
+        first_id : int, default=0
+            Id of the first item. Inputs can refer to all items before.
+
+        Yields
+        ------
+        str
+            Lines including the newline.
+        """
+        item_types = list(self.item_mix)
+        weights = list(self.item_mix.values())
+        patch_names = list(self.patches)
+        for next_id in range(first_id, first_id + num_lines):
+            item_type = self.random.choices(item_types, weights)[0]
+            if next_id == 0 and item_type in "ID":
+                # the first item has nothing to use as input
+                item_type = "L"
+            if item_type == "D" and not patch_names:
+                item_type = "I"
+
+            if item_type == "L":
+                content = self.literal()
+            elif item_type == "C":
+                content = self.creation()
+            elif item_type == "I":
+                content = self.instruction(next_id)
+            else:
+                patch_name = self.random.choice(patch_names)
+                content = "dedup_" + patch_name + self.inputs(
+                    next_id, self.patches[patch_name]
+                )
+            yield f"({next_id}) ({item_type}) {content}\n"
+
+    def patch_lines_of(self, patch_name, first_id):
+        """
+        Lines of one dedup patch, starting with its placeholders IN#0, IN#1, ...
+        """
+        yield "patch_" + patch_name + "\n"
+        num_inputs = self.patches[patch_name]
+        for number in range(num_inputs):
+            yield f"({first_id + number}) (C) IN#{number}\n"
+        for next_id in range(first_id + num_inputs, first_id + self.patch_lines):
+            if self.random.random() < 0.2:
+                yield f"({next_id}) (L) {self.literal()}\n"
+            else:
+                yield f"({next_id}) (I) {self.instruction(next_id, first_id)}\n"
+        yield "\n"
+
+    def write_trace(self, path, num_lines, prefix_lines=0, trace_number=0):
+        """
+        Write one trace.
+
+        Parameters
+        ----------
+        path : str
+            Path of the .lineage file.
+        num_lines : int
+            Number of lines.
+        prefix_lines : int, default=0
+            Number of lines that are equal for all trace numbers.
+        trace_number : int, default=0
+            Traces with different numbers differ after the prefix.
+        """
+        prefix_lines = min(prefix_lines, num_lines)
+        with open(path, "w", encoding="utf-8") as trace_file:
+            self.random.seed(self.seed)
+            trace_file.writelines(self.lines(prefix_lines))
+            self.random.seed(f"{self.seed}-{trace_number}")
+            trace_file.writelines(self.lines(num_lines - prefix_lines, prefix_lines))
+
+    def write_dedup(self, path):
+        """
+        Write the .lineage.dedup file with all patches.
+        """
+        self.random.seed(f"{self.seed}-patches")
+        with open(path, "w", encoding="utf-8") as dedup_file:
+            first_id = 0
+            for patch_name in self.patches:
+                dedup_file.writelines(self.patch_lines_of(patch_name, first_id))
+                first_id += self.patch_lines
+
+    def write_traces(self, path_to_dir, num_traces, num_lines, shared_prefix=0.5):
+        """
+        Write several traces that share a prefix, and the dedup file they refer to.
+
+        Parameters
+        ----------
+        path_to_dir : str
+            Directory to write to. Is created if it does not exist.
+        num_traces : int
+            Number of traces.
+        num_lines : int
+            Number of lines of each trace.
+        shared_prefix : float, default=0.5
+            Fraction of lines at the start that are equal for all traces.
+
+        Returns
+        -------
+        list of pathlib.Path
+            Paths of the written files.
+        """
+        path_to_dir = pathlib.Path(path_to_dir)
+        path_to_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for trace_number in range(num_traces):
+            path = path_to_dir / f"synthetic{trace_number}.lineage"
+            self.write_trace(
+                path, num_lines, int(num_lines * shared_prefix), trace_number
+            )
+            paths.append(path)
+        if self.patches:
+            path = path_to_dir / "synthetic.lineage.dedup"
+            self.write_dedup(path)
+            paths.append(path)
+        return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory", help="directory to write the traces to")
+    parser.add_argument("--traces", type=int, default=1, help="number of traces")
+    parser.add_argument("--lines", type=int, default=100000, help="lines per trace")
+    parser.add_argument(
+        "--mix",
+        type=float,
+        nargs=4,
+        metavar=("L", "C", "I", "D"),
+        help="relative frequency of literals, creations, instructions and dedup items",
+    )
+    parser.add_argument("--fan-in", type=int, nargs=2, default=(1, 3))
+    parser.add_argument(
+        "--shared-prefix", type=float, default=0.5, help="fraction of shared lines"
+    )
+    parser.add_argument(
+        "--frequencies-from",
+        help="directory of traces to take the op_code frequencies from",
+    )
+    parser.add_argument("--op-info", default=LineageTraceDatabase.op_info_path)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    item_mix = None if args.mix is None else dict(zip("LCID", args.mix))
+    op_code_weights = None
+    if args.frequencies_from is not None:
+        trace_files = pathlib.Path(args.frequencies_from).rglob("*.lineage")
+        op_code_weights = op_code_frequencies(trace_files, args.op_info)
+    generator = TraceGenerator(
+        item_mix,
+        tuple(args.fan_in),
+        op_code_weights,
+        args.op_info,
+        seed=args.seed,
+    )
+    for path in generator.write_traces(
+        args.directory, args.traces, args.lines, args.shared_prefix
+    ):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
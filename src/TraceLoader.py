@@ -1,33 +1,189 @@
 from LineageItemGrammar import trace_record
+from LineageItemTokenizer import tokenize_record, tokenize_instruction_line
 import pyparsing as pp
 
+import os
+import mmap
+import gzip
 import pathlib
+import hashlib
+import numpy as np
 import pandas as pd
-from ItemLoader import insert_parsed_row
+from concurrent.futures import ProcessPoolExecutor
+from ItemLoader import insert_parsed_row, has_unresolved_inputs, TraceItemLookup
 from LinageTraceDatabase import LineageTraceDatabase
 import time
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
-def parse_linage_rows(filename):
-    with open(filename, "r", encoding="utf-8") as lineage_trace_file:
-        l = 0
+# suffixes of trace files, optionally followed by a compression suffix
+trace_suffixes = [".lineage", ".dedup"]
+compression_suffixes = [".gz", ".zst"]
+
+
+def is_trace_file(path_to_file):
+    """
+    True for .lineage and .dedup files, also if compressed with gzip or zstd.
+    """
+    suffixes = pathlib.Path(path_to_file).suffixes
+    if suffixes and suffixes[-1] in compression_suffixes:
+        suffixes = suffixes[:-1]
+    return len(suffixes) > 0 and suffixes[-1] in trace_suffixes
+
+
+def is_patch_file(path_to_file):
+    """
+    True for .dedup files, which only contain the patches of dedup items.
+    """
+    return ".dedup" in pathlib.Path(path_to_file).suffixes
+
+
+def open_trace(filename):
+    """
+    Open a trace file for reading text, decompressing .gz and .zst files while reading.
+    """
+    suffix = pathlib.Path(filename).suffix
+    if suffix == ".gz":
+        return gzip.open(filename, "rt", encoding="utf-8")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("reading .zst traces requires the zstandard package")
+        return zstandard.open(filename, "rt", encoding="utf-8")
+    return open(filename, "r", encoding="utf-8")
+
+
+def parse_linage_rows(filename, use_tokenizer=True, use_mmap=True):
+    """
+    Parse a lineage trace file line by line.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the lineage trace.
+    use_tokenizer : bool, default=True
+        Use the fast split based tokenizer and only fall back to the
+        pyparsing grammar for lines it can not handle.
+        If False, every line is parsed by the grammar.
+    use_mmap : bool, default=True
+        Memory map the file and tokenize instruction lines without decoding
+        the whole line. Only used together with the tokenizer
+        and for uncompressed files.
+
+    Yields
+    ------
+    dict
+        Parsed row data of each line.
+    """
+    compressed = pathlib.Path(filename).suffix in compression_suffixes
+    if use_tokenizer and use_mmap and not compressed:
+        yield from parse_linage_rows_mmap(filename)
+        return
+    with open_trace(filename) as lineage_trace_file:
         for line_num, line in enumerate(lineage_trace_file):
-            l = line_num
-            try:
-                parsed_data = trace_record.parse_string(line)
-            except pp.ParseException as e:
-                print("Parsed line " + repr(line))
-                raise Exception(
-                    "Invalid input on line " + str(line_num) + ": " + str(e)
-                )
-            yield parsed_data.as_dict()
-
-
-def load_trace(path_to_file, database):
+            yield parse_line(line, line_num, use_tokenizer)
+
+
+def parse_line(line, line_num, use_tokenizer=True):
+    if use_tokenizer:
+        parsed_data = tokenize_record(line)
+        if parsed_data is not None:
+            return parsed_data
+    try:
+        parsed_data = trace_record.parse_string(line)
+    except pp.ParseException as e:
+        print("Parsed line " + repr(line))
+        raise Exception("Invalid input on line " + str(line_num) + ": " + str(e))
+    return parsed_data.as_dict()
+
+
+def line_ends(buffer, block_size=1 << 26):
+    """
+    End positions of all lines in a bytes-like buffer, after the line break.
+    Line breaks are searched with numpy, one block of the buffer at a time.
+    """
+    size = len(buffer)
+    for block_start in range(0, size, block_size):
+        count = min(block_size, size - block_start)
+        block = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=block_start)
+        ends = (np.flatnonzero(block == ord("\n")) + (block_start + 1)).tolist()
+        # release the buffer before yielding, so a mmap can be closed any time
+        del block
+        yield from ends
+    if size > 0 and buffer[size - 1] != ord("\n"):
+        # last line without line break
+        yield size
+
+
+def parse_linage_rows_mmap(filename):
+    """
+    Parse a lineage trace through a memory map of the file.
+    Gives the same rows as parse_linage_rows with use_mmap=False.
+    """
+    with open(filename, "rb") as lineage_trace_file:
+        if os.fstat(lineage_trace_file.fileno()).st_size == 0:
+            # empty files can not be mapped
+            return
+        with mmap.mmap(
+            lineage_trace_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as buffer:
+            start = 0
+            for line_num, end in enumerate(line_ends(buffer)):
+                parsed_data = tokenize_instruction_line(buffer, start, end)
+                if parsed_data is None:
+                    line = buffer[start:end].decode("utf-8")
+                    if line.endswith("\r\n"):
+                        # like reading in text mode
+                        line = line[:-2] + "\n"
+                    parsed_data = parse_line(line, line_num)
+                yield parsed_data
+                start = end
+
+
+def file_hash(path_to_file):
+    """
+    SHA-256 hex digest of the content of a file.
+    """
+    sha256 = hashlib.sha256()
+    with open(path_to_file, "rb") as trace_file:
+        for block in iter(lambda: trace_file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def load_trace(path_to_file, database, chunk_size=None, hash_file=False):
+    """
+    Loads a single lineage trace into the buffers of a Database object.
+    A .dedup file adds no trace, its items are stored in patch_item
+    and the file in patch_file.
+
+    Parameters
+    ----------
+    path_to_file : str
+        Path to the lineage trace, can be compressed, see load_directory.
+    database : LineageTraceDatabase
+        Database to add the trace to.
+    chunk_size : int, default=None
+        If set, the buffers are converted to dataframe chunks
+        whenever this many trace items are buffered, to keep memory bounded.
+    hash_file : bool, default=False
+        Store the SHA-256 digest of the file in the file_hash column of the trace,
+        which incremental loads compare against. Reads the file a second time,
+        file_hash is missing otherwise.
+
+    Returns
+    -------
+    LineageTraceDatabase
+        The database passed in.
+    """
     # print("Loading trace from " + str(path_to_file))
-    last_modified = pd.to_datetime(
-        pathlib.Path(path_to_file).stat().st_mtime, unit="s"
-    ).tz_localize("UTC")
+    stats = database.stats
+    if stats is not None:
+        stats.start_file(path_to_file)
+    stat = pathlib.Path(path_to_file).stat()
+    last_modified = pd.Timestamp(stat.st_mtime_ns, unit="ns", tz="UTC")
 
     new_id = len(database.trace_buffer)
 
@@ -38,23 +194,164 @@ def load_trace(path_to_file, database):
         "total_execution_time": pd.Timedelta(0),
         "name": pathlib.Path(path_to_file).name,
         "description": "",
+        "file_size": stat.st_size,
+        "file_hash": file_hash(path_to_file) if hash_file else None,
     }
 
-    database.trace_buffer.append(trace_item)
+    if is_patch_file(path_to_file):
+        database.patch_file_buffer.append_record(trace_item)
+    else:
+        database.trace_buffer.append_record(trace_item)
 
+    # ids are only valid within one file
+    database.trace_item_lookup = TraceItemLookup()
+    database.trace_value_hashes = set()
     database.current_dedup_patch = None
-    for idx, parsed_data in enumerate(list(parse_linage_rows(path_to_file))):
+    # patch rows whose inputs are defined later in a sibling patch
+    pending = []
+    rows = parse_linage_rows(path_to_file)
+    if stats is not None:
+        rows = stats.timed_rows(rows)
+    for idx, parsed_data in enumerate(rows):
         # print(parsed_data)
-        try:
-            insert_parsed_row(parsed_data, new_id, database)
-        except KeyError as e:
-            print(f"Error on line {idx+1} of file '{trace_item['name']}': {e}")
-            print(parsed_data)
-            raise
+        if database.current_dedup_patch is not None and has_unresolved_inputs(
+            parsed_data, database
+        ):
+            pending.append((idx, database.current_dedup_patch, parsed_data))
+            continue
+        insert_trace_row(idx, parsed_data, new_id, trace_item, database)
+        if chunk_size is not None and len(database.trace_item_buffer) >= chunk_size:
+            database.flush_buffers()
+
+    while pending:
+        still_pending = []
+        for idx, patch, parsed_data in pending:
+            if has_unresolved_inputs(parsed_data, database):
+                still_pending.append((idx, patch, parsed_data))
+                continue
+            database.current_dedup_patch = patch
+            insert_trace_row(idx, parsed_data, new_id, trace_item, database)
+        database.current_dedup_patch = None
+        if len(still_pending) == len(pending):
+            # no progress, report the first row that can not be resolved
+            idx, patch, parsed_data = still_pending[0]
+            database.current_dedup_patch = patch
+            insert_trace_row(idx, parsed_data, new_id, trace_item, database)
+        pending = still_pending
+    # not needed after the file is loaded
+    database.trace_item_lookup = None
+    if stats is not None:
+        stats.end_file()
     return database
 
 
-def load_directory(path_to_dir, database=None):
+def insert_trace_row(idx, parsed_data, trace_id, trace_item, database):
+    stats = database.stats
+    if stats is not None:
+        start = time.perf_counter()
+    try:
+        insert_parsed_row(parsed_data, trace_id, database)
+    except KeyError as e:
+        print(f"Error on line {idx+1} of file '{trace_item['name']}': {e}")
+        print(parsed_data)
+        raise
+    if stats is not None:
+        stats.add_time("insert", time.perf_counter() - start)
+
+
+def load_trace_buffers(path_to_file, database, chunk_size=None, hash_file=False):
+    """
+    Parses and hashes a single trace into the buffers of an empty database.
+    Used by the worker processes of load_directory.
+    """
+    return load_trace(path_to_file, database, chunk_size, hash_file)
+
+
+def trace_files_state(trace_files):
+    """
+    Path, modification time and size of each trace file.
+    Used to check if a cached database is still up to date.
+    """
+    state = []
+    for path_to_file in trace_files:
+        stat = pathlib.Path(path_to_file).stat()
+        state.append([str(path_to_file), stat.st_mtime_ns, stat.st_size])
+    return state
+
+
+def find_new_trace_files(trace_files, database, incremental):
+    """
+    Select the trace files that have to be loaded into an already loaded database.
+
+    Parameters
+    ----------
+    trace_files : list of pathlib.Path
+        Trace files found in the directory.
+    database : LineageTraceDatabase
+        Database converted to pandas.
+    incremental : bool
+        If True, files already in the trace table are only selected if their
+        content changed. Otherwise all files are selected as new traces.
+
+    Returns
+    -------
+    list of pathlib.Path, list of int
+        Files to load and the trace id each of the trace files among them
+        should get, .dedup files get no trace id.
+        Files that were only touched get their new date and size in the trace
+        or patch_file table, so they are not hashed again on the next load.
+    """
+    trace = database.trace
+    next_id = trace.index.max() + 1 if len(trace) > 0 else 0
+    known_files = {}
+    if incremental:
+        known_files = {
+            file: (trace, trace_id) for file, trace_id in zip(trace.file, trace.index)
+        }
+        patch_file = database.patch_file
+        known_files.update((file, (patch_file, file)) for file in patch_file.index)
+
+    new_files = []
+    trace_ids = []
+    for path_to_file in trace_files:
+        table, key = known_files.get(str(path_to_file), (None, None))
+        if table is None:
+            new_files.append(path_to_file)
+            if not is_patch_file(path_to_file):
+                trace_ids.append(next_id)
+                next_id += 1
+            continue
+        stat = path_to_file.stat()
+        last_modified = pd.Timestamp(stat.st_mtime_ns, unit="ns", tz="UTC")
+        if (
+            table.at[key, "date"] == last_modified
+            and table.at[key, "file_size"] == stat.st_size
+        ):
+            continue
+        # files loaded without hashing are loaded again
+        stored = table.at[key, "file_hash"]
+        if pd.notna(stored) and stored == file_hash(path_to_file):
+            table.at[key, "date"] = last_modified
+            table.at[key, "file_size"] = stat.st_size
+            continue
+        new_files.append(path_to_file)
+        if table is trace:
+            trace_ids.append(key)
+    return new_files, trace_ids
+
+
+def load_directory(
+    path_to_dir,
+    database=None,
+    workers=None,
+    chunk_size=None,
+    cache=None,
+    incremental=False,
+    hash_format="hex",
+    hash_backend="sha256",
+    stats=None,
+    sql_database=None,
+):
     """
     Loads a directory containing lineage traces into Database object.
 
@@ -63,30 +360,147 @@ def load_directory(path_to_dir, database=None):
     path_to_dir : str
         str to directory containing traces.
         Can also contain other files and subdirectorys.
+        Traces compressed with gzip (.lineage.gz, .lineage.dedup.gz) or
+        zstd (.lineage.zst, needs the zstandard package) are decompressed while reading.
     database : LineageTraceDatabase, default=None
         Already loaded database to add new traces to.
+    workers : int, default=None
+        Number of processes used to parse and hash the trace files.
+        Each file is loaded into its own buffers, which are merged in file order,
+        so trace ids and hashes are the same as for a serial load.
+        If None or 1, all files are loaded in this process.
+    chunk_size : int, default=None
+        If set, buffered rows are converted to dataframe chunks every
+        chunk_size trace items, so memory does not grow with the size of the buffers.
+    cache : str, default=None
+        Directory for a parquet copy of the loaded database.
+        If the trace files did not change since the cache was written,
+        the database is loaded from there instead of parsing the traces.
+        Otherwise the traces are loaded and the cache is rewritten.
+        Only used if no database is passed.
+    incremental : bool, default=False
+        Only load files that are not yet in the database or whose content changed,
+        based on modification time, size and content hash stored in the trace table.
+        Rows of changed traces are replaced, new traces are appended.
+        Traces of removed files are kept.
+        With cache, an outdated cache is updated this way instead of being rebuilt.
+    hash_format : str, default="hex"
+        Storage format of the hashes, see LineageTraceDatabase.
+        Only used if no database is passed.
+    hash_backend : str, default="sha256"
+        Hash function for value and lineage hashes, see LineageTraceDatabase.
+        Only used if no database is passed.
+    stats : LoadStats, default=None
+        Collects timings and counts of the loaded files, see LoadStats.
+        Nothing is collected if the database is read from the cache.
+    sql_database : SqlTraceDatabase, default=None
+        If set, the traces are bulk-loaded into this database instead of converted
+        to pandas. Buffered rows are inserted after each file, or every chunk_size
+        trace items, with one transaction per table. Its secondary indexes are
+        rebuilt after all files are loaded. Uses the settings of sql_database,
+        can not be combined with database, cache or incremental.
 
     Returns
     -------
-    LineageTraceDatabase
-        Database object containing information of all loaded traces as pandas dataframes.
+    LineageTraceDatabase or SqlTraceDatabase
+        Database object containing information of all loaded traces as pandas dataframes,
+        or sql_database if given.
 
     """
-    if database is None:
-        database = LineageTraceDatabase()
+    if sql_database is not None and (
+        database is not None or cache is not None or incremental
+    ):
+        raise RuntimeError(
+            "sql_database can not be combined with database, cache or incremental"
+        )
 
-    # suffixes = [".lineage", ".dedup"]
-    suffixes = [".lineage"]
+    # .dedup files contain the patches referenced by the (D) items of other traces
     trace_files = [
         path_to_file
         for path_to_file in pathlib.Path(path_to_dir).rglob("*")
-        if path_to_file.suffix in suffixes
+        if is_trace_file(path_to_file)
     ]
 
-    for path_to_file in trace_files:
-        load_trace(path_to_file, database)
+    use_cache = database is None and cache is not None
+    if use_cache:
+        state = trace_files_state(trace_files)
+        cache_metadata = LineageTraceDatabase.read_metadata(cache)
+        settings = {"hash_format": hash_format, "hash_backend": hash_backend}
+        cached_settings = LineageTraceDatabase.default_settings | cache_metadata
+        saved_tables = all(
+            (pathlib.Path(cache) / (table + ".parquet")).exists()
+            for table in LineageTraceDatabase.tables
+        )
+        if {key: cached_settings[key] for key in settings} != settings or (
+            not saved_tables
+        ):
+            # cache was built with different settings or tables
+            cache_metadata = {}
+        if cache_metadata.get("trace_files") == state:
+            return LineageTraceDatabase.load(cache)
+        if incremental and cache_metadata:
+            database = LineageTraceDatabase.load(cache)
+
+    if sql_database is not None:
+        database = LineageTraceDatabase(**sql_database.settings())
+        database.sink = sql_database
+        sql_database.begin_load()
+    if database is None:
+        database = LineageTraceDatabase(
+            hash_format=hash_format, hash_backend=hash_backend
+        )
+    if stats is not None:
+        database.stats = stats
+
+    # add to a database that was already converted to pandas
+    loaded_database = None
+    # file_hash is only compared by incremental loads, also of a cached database
+    hash_file = incremental or use_cache
+    if hasattr(database, "trace"):
+        loaded_database = database
+        trace_files, trace_ids = find_new_trace_files(
+            trace_files, loaded_database, incremental
+        )
+        database = loaded_database.empty_copy()
+        database.stats = loaded_database.stats
+
+    if workers is None or workers <= 1:
+        for path_to_file in trace_files:
+            load_trace(path_to_file, database, chunk_size, hash_file)
+            if sql_database is not None:
+                database.flush_buffers()
+    else:
+        worker_database = database.empty_copy()
+        if database.stats is not None:
+            worker_database.stats = database.stats.empty_copy()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for trace_database in executor.map(
+                load_trace_buffers,
+                trace_files,
+                [worker_database] * len(trace_files),
+                [chunk_size] * len(trace_files),
+                [hash_file] * len(trace_files),
+            ):
+                database.extend_buffers(trace_database)
+                if sql_database is not None:
+                    database.flush_buffers()
+
+    if sql_database is not None:
+        database.flush_buffers()
+        sql_database.write_frame("trace", database.buffer_to_frame("trace"))
+        sql_database.write_frame("op_info", database.read_op_info())
+        sql_database.end_load()
+        return sql_database
 
     # print("building dataframes from buffers")
     database.to_pandas()
 
+    if loaded_database is not None:
+        loaded_database.merge(database, trace_ids)
+        database = loaded_database
+
+    if use_cache:
+        database.metadata["trace_files"] = state
+        database.save(cache)
+
     return database
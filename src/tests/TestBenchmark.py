@@ -0,0 +1,52 @@
+import sys
+import json
+
+sys.path.append("./src")
+
+from Benchmark import scale_trace, run, compare
+from TraceLoader import load_directory
+
+
+def test_scale_trace(tmp_path):
+    num_lines = scale_trace(
+        "./src/tests/traces/test1.lineage", tmp_path / "scaled.lineage", 20
+    )
+    assert num_lines == 24
+    scaled_db = load_directory(tmp_path)
+    original_db = load_directory("./src/tests/traces")
+    original_items = original_db.trace_item.loc[
+        original_db.trace.index[original_db.trace.name == "test1.lineage"][0]
+    ]
+    scaled_items = scaled_db.trace_item.loc[0]
+    assert len(scaled_items) == 3 * len(original_items)
+    # every copy has the same items with shifted ids
+    assert scaled_items.type.tolist() == 3 * original_items.type.tolist()
+    assert scaled_items.index[8] == original_items.index[0] + 10002
+    # but only the literal is shared, all other items have new value hashes
+    assert scaled_items.value_hash[:8].tolist() == original_items.value_hash.tolist()
+    copies = scaled_items.value_hash.to_numpy().reshape(3, -1)
+    is_literal = (original_items.type == "LITERAL").to_numpy()
+    assert not (copies[0] == copies[1])[~is_literal].any()
+    assert not (copies[1] == copies[2])[~is_literal].any()
+    assert (copies[0] == copies[2])[is_literal].all()
+
+
+def test_run():
+    results = run(
+        "./src/tests/traces",
+        "./src/tests/traces/test1.lineage",
+        scale_lines=100,
+        repeat=1,
+    )
+    results = json.loads(json.dumps(results))
+    for dataset in ["traces", "synthetic"]:
+        assert set(results["datasets"][dataset]["seconds"]) == {
+            "parse",
+            "hash",
+            "insert",
+            "to_pandas",
+        }
+        assert "critical_path" in results["datasets"][dataset]["queries"]
+    assert results["datasets"]["synthetic"]["lines"] >= 100
+    comparison = compare(results, results)
+    assert (comparison.ratio.dropna() == 1).all()
@@ -3,10 +3,20 @@ from pprint import pprint
 
 sys.path.append("./src")
 
-from TraceLoader import load_directory
+from TraceLoader import load_directory, load_trace
 from QueryInterface import QueryInterface
+from LinageTraceDatabase import LineageTraceDatabase
+from ItemLoader import hashes_to_int64, TraceItemLookup
+from LoadStats import LoadStats
+from SqlTraceDatabase import SqlTraceDatabase, SqlQueryInterface
+from CriticalPath import dag_levels
+from TraceDivergence import PrefixHashIndex
 import os
+import gzip
+import shutil
+import pytest
 import pandas as pd
+import numpy as np
 
 
 def load_database():
@@ -40,6 +50,213 @@ def test_trace_date():
     )
 
 
+def test_parallel_load():
+    parallel_db = load_directory("./src/tests/traces", workers=2)
+    assert parallel_db.trace[["file", "name"]].equals(db.trace[["file", "name"]])
+    hashes = ["value_hash", "lineage_hash", "type"]
+    assert parallel_db.trace_item[hashes].equals(db.trace_item[hashes])
+    assert parallel_db.instruction.index.equals(db.instruction.index)
+    assert parallel_db.literal.equals(db.literal)
+    assert parallel_db.lineage.index.equals(db.lineage.index)
+
+
+def test_chunked_load():
+    chunked_db = load_directory("./src/tests/traces", chunk_size=3)
+    hashes = ["value_hash", "lineage_hash", "type"]
+    assert chunked_db.trace_item[hashes].equals(db.trace_item[hashes])
+    assert chunked_db.instruction.index.equals(db.instruction.index)
+    assert chunked_db.literal.equals(db.literal)
+    assert chunked_db.lineage.index.equals(db.lineage.index)
+    assert (chunked_db.creation.dtypes == db.creation.dtypes).all()
+
+
+def test_shared_values(tmp_path):
+    shutil.copy("./src/tests/traces/test1.lineage", tmp_path / "a.lineage")
+    single_stats = LoadStats()
+    load_directory(tmp_path, stats=single_stats)
+    single_rows = single_stats.summary()["buffer_rows"]
+    shutil.copy("./src/tests/traces/test1.lineage", tmp_path / "b.lineage")
+    for options in [{}, {"workers": 2}]:
+        stats = LoadStats()
+        shared_db = load_directory(tmp_path, stats=stats, **options)
+        buffer_rows = stats.summary()["buffer_rows"]
+        # rows of the second trace are only referenced
+        for table in ["instruction", "literal", "creation", "lineage"]:
+            assert buffer_rows[table] == single_rows[table]
+        assert buffer_rows["trace_item"] == 2 * single_rows["trace_item"]
+        for trace_id in [0, 1]:
+            assert set(shared_db.trace_value.loc[trace_id].index) == set(
+                shared_db.trace_item.loc[trace_id].value_hash
+            )
+
+    assert db.trace_value.index.is_unique
+    assert set(db.trace_value.index.get_level_values("value_hash")) == set(
+        db.trace_item.value_hash
+    )
+
+
+def test_trace_item_lookup():
+    lookup = TraceItemLookup()
+    lookup.add("10", "value", "lineage")
+    assert "10" in lookup
+    assert "3" not in lookup
+    assert "11" not in lookup
+    assert lookup["10"] == ("value", "lineage")
+    # sparse ids need no slots in between
+    lookup.add("1000000000", "value", "lineage")
+    assert len(lookup.hashes) == 2
+
+    database = LineageTraceDatabase()
+    load_trace("./src/tests/traces/test1.lineage", database)
+    # released after the file is loaded
+    assert database.trace_item_lookup is None
+    assert len(database.trace_item_buffer) == 8
+
+
+def test_load_stats():
+    reported = []
+    stats = LoadStats(callback=reported.append)
+    stats_db = load_directory("./src/tests/traces", stats=stats)
+    assert stats_db.stats is stats
+    assert len(stats.files) == 2
+    assert len(reported) == 2
+    # tables are built on first access
+    stats_db.instruction
+    assert reported[-1]["to_pandas"].keys() == {"instruction"}
+
+    summary = stats.summary()
+    assert summary["lines"] == 18
+    assert summary["items"] == {"L": 2, "C": 6, "I": 8, "D": 2}
+    assert summary["items"]["I"] == len(stats_db.instruction)
+    assert all(seconds >= 0 for seconds in summary["seconds"].values())
+    assert summary["buffer_rows"]["trace_item"] == len(stats_db.trace_item)
+    assert list(stats.to_frame()["seconds.hash"] >= 0) == [True, True]
+
+    parallel_stats = LoadStats()
+    load_directory("./src/tests/traces", workers=2, stats=parallel_stats)
+    assert parallel_stats.summary()["items"] == summary["items"]
+
+
+def test_compressed_traces(tmp_path):
+    for name in ["test1.lineage", "test2.lineage"]:
+        with open("./src/tests/traces/" + name, "rb") as trace_file:
+            with gzip.open(tmp_path / (name + ".gz"), "wb") as compressed_file:
+                shutil.copyfileobj(trace_file, compressed_file)
+    with open("./traces/3.lineage.dedup", "rb") as trace_file:
+        with gzip.open(tmp_path / "3.lineage.dedup.gz", "wb") as compressed_file:
+            shutil.copyfileobj(trace_file, compressed_file)
+    (tmp_path / "other.gz").write_bytes(b"")
+
+    compressed_db = load_directory(tmp_path)
+    assert sorted(compressed_db.trace.name) == ["test1.lineage.gz", "test2.lineage.gz"]
+    assert set(compressed_db.trace_item.value_hash) == set(db.trace_item.value_hash)
+    assert list(compressed_db.patch_file.index) == [str(tmp_path / "3.lineage.dedup.gz")]
+    assert len(compressed_db.patch_item) == 97
+
+
+def test_zstd_traces(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    with open("./src/tests/traces/test1.lineage", "rb") as trace_file:
+        with zstandard.open(tmp_path / "test1.lineage.zst", "wb") as compressed_file:
+            shutil.copyfileobj(trace_file, compressed_file)
+    compressed_db = load_directory(tmp_path)
+    assert list(compressed_db.trace.name) == ["test1.lineage.zst"]
+    assert len(compressed_db.trace_item) == 8
+
+
+def test_save_load(tmp_path):
+    db.save(tmp_path)
+    loaded_db = LineageTraceDatabase.load(tmp_path)
+    for table in list(db.tables) + ["op_info"]:
+        assert getattr(loaded_db, table).equals(getattr(db, table))
+        assert (getattr(loaded_db, table).dtypes == getattr(db, table).dtypes).all()
+        index = getattr(loaded_db, table).index.to_frame()
+        assert (index.dtypes == getattr(db, table).index.to_frame().dtypes).all()
+
+
+def test_directory_cache(tmp_path):
+    cached_db = load_directory("./src/tests/traces", cache=tmp_path)
+    assert cached_db.metadata["trace_files"] == load_directory(
+        "./src/tests/traces", cache=tmp_path
+    ).metadata["trace_files"]
+    os.utime("./src/tests/traces/test2.lineage", None)
+    reloaded_db = load_directory("./src/tests/traces", cache=tmp_path)
+    assert reloaded_db.metadata["trace_files"] != cached_db.metadata["trace_files"]
+    assert reloaded_db.trace_item.value_hash.equals(cached_db.trace_item.value_hash)
+    # a cache without all tables is rebuilt
+    (tmp_path / "trace_value.parquet").unlink()
+    rebuilt_db = load_directory("./src/tests/traces", cache=tmp_path)
+    assert rebuilt_db.trace_value.index.equals(cached_db.trace_value.index)
+    assert (tmp_path / "trace_value.parquet").exists()
+
+
+def test_incremental_load(tmp_path):
+    shutil.copy("./src/tests/traces/test1.lineage", tmp_path)
+    # file hashes are only computed for incremental loads
+    unhashed_db = load_directory(tmp_path)
+    assert unhashed_db.trace.file_hash.isna().all()
+    # a touched file without stored hash is loaded again
+    os.utime(tmp_path / "test1.lineage", None)
+    unhashed_db = load_directory(tmp_path, unhashed_db, incremental=True)
+    assert len(unhashed_db.trace) == 1
+    assert unhashed_db.trace.file_hash.notna().all()
+    incremental_db = load_directory(tmp_path, incremental=True)
+    trace_item_before = incremental_db.trace_item.loc[0]
+    shutil.copy("./src/tests/traces/test2.lineage", tmp_path)
+    os.utime(tmp_path / "test1.lineage", None)
+    incremental_db = load_directory(tmp_path, incremental_db, incremental=True)
+    assert len(incremental_db.trace) == 2
+    assert incremental_db.trace_item.loc[0].equals(trace_item_before)
+    # the touched file is not hashed again
+    mtime = (tmp_path / "test1.lineage").stat().st_mtime_ns
+    assert incremental_db.trace.at[0, "date"].value == mtime
+    assert incremental_db.trace.loc[1, "name"] == "test2.lineage"
+    assert len(incremental_db.trace_item) == 18
+
+    shutil.copy("./src/tests/traces/test2.lineage", tmp_path / "test1.lineage")
+    incremental_db = load_directory(tmp_path, incremental_db, incremental=True)
+    assert len(incremental_db.trace) == 2
+    assert incremental_db.trace.file_hash.nunique() == 1
+    assert len(incremental_db.trace_item) == 20
+    assert len(incremental_db.literal) == 1
+
+
+def test_int64_hash_format():
+    int_db = load_directory("./src/tests/traces", hash_format="int64")
+    assert int_db.trace_item.value_hash.dtype == "int64"
+    assert list(int_db.trace_item.value_hash) == list(
+        hashes_to_int64(db.trace_item.value_hash)
+    )
+    assert set(int_db.lineage.index) == set(
+        zip(
+            hashes_to_int64(db.lineage.index.get_level_values(0)),
+            hashes_to_int64(db.lineage.index.get_level_values(1)),
+        )
+    )
+    int_qi = QueryInterface(int_db)
+    assert int_qi.compare_instruction_count(type="INSTRUCTION").equals(
+        QueryInterface(db).compare_instruction_count(type="INSTRUCTION")
+    )
+    assert int_qi.compare_traces_by_id(0, 1) == 6
+
+
+def test_hash_backend(tmp_path):
+    blake_db = load_directory(
+        "./src/tests/traces", hash_backend="blake2b", cache=tmp_path
+    )
+    assert blake_db.metadata["hash_backend"] == "blake2b"
+    assert blake_db.trace_item.value_hash.str.len().eq(32).all()
+    assert len(blake_db.instruction) == len(db.instruction)
+    assert len(blake_db.lineage) == len(db.lineage)
+    assert QueryInterface(blake_db).compare_traces_by_id(0, 1) == 6
+    assert QueryInterface(blake_db).compare_traces_by_id(0, 1, "value") == 3
+
+    # cache of another backend is not used
+    sha_db = load_directory("./src/tests/traces", cache=tmp_path)
+    assert sha_db.metadata["hash_backend"] == "sha256"
+    assert sha_db.trace_item.value_hash.equals(db.trace_item.value_hash)
+
+
 def test_trace_item_length():
     assert len(db.trace_item) == 18
 
@@ -158,6 +375,58 @@ def test_dedup():
     assert dedup["dedup_name"] == "dedup_X_SB515_3"
 
 
+def test_dedup_patches(tmp_path):
+    shutil.copy("./src/tests/traces/test1.lineage", tmp_path)
+    shutil.copy("./traces/3.lineage.dedup", tmp_path)
+    dedup_db = load_directory(tmp_path, incremental=True)
+    # patch files are no traces, item ids repeat across their patches
+    assert list(dedup_db.trace.name) == ["test1.lineage"]
+    assert dedup_db.trace_item.index.is_unique
+    assert dedup_db.patch_item.index.is_unique
+    assert len(dedup_db.patch_item.loc["beg_SB515_0"]) == 6
+    query = QueryInterface(dedup_db)
+    assert list(query.compare_total_operations().index) == [0]
+    assert list(query.find_trace_long_operation().index) == [0]
+    trace_id = dedup_db.trace.index[dedup_db.trace.name == "test1.lineage"][0]
+    items = dedup_db.trace_item.loc[trace_id]
+    dedup_item = items.loc[22]
+    input_item = items.loc[12]
+    assert dedup_db.dedup.loc[dedup_item.value_hash].input_hashes[0] == (
+        input_item.value_hash
+    )
+
+    patch = query.expand_dedup(dedup_item.value_hash)
+    assert (patch.index.get_level_values("patch_name") == "X_SB515_3").all()
+    assert len(patch) == 42
+    placeholder = patch.loc[patch.bound_value_hash.notna()]
+    assert placeholder.index.get_level_values("id").tolist() == [1055]
+    assert placeholder.bound_value_hash.iloc[0] == input_item.value_hash
+    placeholder_creation = dedup_db.creation.loc[placeholder.value_hash.iloc[0]]
+    assert placeholder_creation.dedup_in == 0
+
+    # int64 hashes are bound exactly, without a detour through float
+    int_db = load_directory(tmp_path, hash_format="int64")
+    int_items = int_db.trace_item.loc[trace_id]
+    int_patch = QueryInterface(int_db).expand_dedup(int_items.loc[22].value_hash)
+    assert int_patch.bound_value_hash.dtype == "Int64"
+    int_placeholder = int_patch.loc[int_patch.bound_value_hash.notna()]
+    assert int_placeholder.index.get_level_values("id").tolist() == [1055]
+    assert int_placeholder.bound_value_hash.iloc[0] == int_items.loc[12].value_hash
+
+    # unchanged patch files are not loaded again
+    patch_item = dedup_db.patch_item
+    os.utime(tmp_path / "3.lineage.dedup", None)
+    stats = LoadStats()
+    dedup_db = load_directory(tmp_path, dedup_db, incremental=True, stats=stats)
+    assert len(stats.files) == 0
+    assert dedup_db.patch_item.equals(patch_item)
+    assert len(dedup_db.trace) == 1
+    shutil.copy("./traces/17.lineage.dedup", tmp_path / "3.lineage.dedup")
+    dedup_db = load_directory(tmp_path, dedup_db, incremental=True)
+    assert dedup_db.patch_item.index.is_unique
+    assert len(dedup_db.patch_file) == 1
+
+
 def test_trace_item():
     items_trace_1 = db.trace_item.reset_index().join(db.trace, on="trace_id")
     items_trace_1 = items_trace_1.loc[items_trace_1.name == "test1.lineage"]
@@ -223,6 +492,28 @@ def test_find_trace_long_operation():
         assert op["execution_time"] >= pd.Timedelta(milliseconds=500)
 
 
+def test_find_trace_long_operation_top_k():
+    ops = qi.find_trace_long_operation(min_time_ms=10, top_k=3)
+    assert len(ops) == 6
+    for trace_id in [0, 1]:
+        times = ops.loc[trace_id, "execution_time"]
+        assert times.is_monotonic_decreasing
+        assert times.iloc[0] == db.trace_item.loc[trace_id, "execution_time"].max()
+    longest = qi.find_trace_long_operation(min_time_ms=10)
+    assert longest.loc[0, "id"] == db.trace_item.loc[0, "execution_time"].idxmax()
+
+
+def test_execution_time_percentiles():
+    percentiles = qi.execution_time_percentiles()
+    assert list(percentiles.columns) == ["p50", "p95", "p99"]
+    assert percentiles.loc[0, "p50"] == db.trace_item.loc[0, "execution_time"].median()
+    by_op_code = qi.execution_time_percentiles(
+        by="op_code", percentiles=(0.5,), type="INSTRUCTION"
+    )
+    assert list(by_op_code.columns) == ["p50"]
+    assert len(by_op_code) == 6
+
+
 def test_compare_instruction_count():
     assert len(qi.compare_instruction_count()) == 2
     assert qi.compare_instruction_count().loc[0, "item_count"] == 8
@@ -252,3 +543,204 @@ def test_compare_traces_by_id():
     assert qi.compare_traces_by_id(1, 0) == 6
     assert qi.compare_traces_by_id(0, 1, compare_by="value") == 3
     assert qi.compare_traces_by_id(1, 0, compare_by="value") == 3
+
+    empty_index = PrefixHashIndex(db.trace_item.iloc[:0], "value_hash")
+    with pytest.raises(KeyError):
+        empty_index.trace_positions([0])
+    assert len(empty_index.trace_positions([])) == 0
+
+
+def test_ancestors():
+    find_hash = lambda x: db.trace_item.loc[(0, x), "value_hash"]
+    ancestors = qi.ancestors(find_hash(10001))
+    expected = {10000: 1, 4074: 2, 7: 2, 22: 3, 12: 3}
+    assert dict(ancestors.distance) == {
+        find_hash(id): distance for id, distance in expected.items()
+    }
+    assert set(qi.ancestors(find_hash(10001), max_depth=2).index) == {
+        find_hash(10000),
+        find_hash(4074),
+        find_hash(7),
+    }
+    assert len(qi.ancestors(find_hash(12))) == 0
+
+
+def test_descendants():
+    find_hash = lambda x: db.trace_item.loc[(0, x), "value_hash"]
+    descendants = qi.descendants(find_hash(22))
+    assert dict(descendants.distance) == {
+        find_hash(4074): 1,
+        find_hash(10000): 2,
+        find_hash(10001): 3,
+    }
+
+
+def test_subgraph_between():
+    find_hash = lambda x: db.trace_item.loc[(0, x), "value_hash"]
+    subgraph = qi.subgraph_between(find_hash(22), find_hash(10001))
+    edges = [(22, 4074), (4074, 10000), (10000, 10001)]
+    assert set(subgraph.index) == {(find_hash(x), find_hash(y)) for x, y in edges}
+    assert len(qi.subgraph_between(find_hash(10001), find_hash(22))) == 0
+
+
+def test_critical_path():
+    path = qi.critical_path(0)
+    time = db.trace_item.loc[0, "execution_time"]
+    assert path.loc[(0, 12), "earliest_finish"] == time[12]
+    assert path.loc[(0, 22), "earliest_finish"] == max(time[12], time[7]) + time[22]
+    assert path.loc[(0, 10001), "earliest_finish"] == path.earliest_finish.max()
+    critical = path[path.critical]
+    assert critical.execution_time.sum() == path.earliest_finish.max()
+    assert (critical.slack == pd.Timedelta(0)).all()
+    assert (path.slack >= pd.Timedelta(0)).all()
+    # items without consumers can take until the end of the trace
+    assert path.loc[(0, 8), "slack"] == path.earliest_finish.max() - time[8]
+
+    all_paths = qi.critical_path()
+    assert len(all_paths) == len(db.trace_item)
+    assert all_paths.loc[0].equals(path.loc[0])
+
+    # 0 <- 1 <- 3, 0 <- 2 <- 3, 3 <- 4
+    indptr = np.array([0, 0, 1, 2, 4, 5])
+    inputs = np.array([0, 0, 1, 2, 3])
+    assert dag_levels(indptr, inputs).tolist() == [0, 1, 1, 2, 3]
+    # 0 <-> 1
+    assert dag_levels(np.array([0, 1, 2]), np.array([1, 0])) is None
+
+
+def test_compare_traces_matrix():
+    matrix = qi.compare_traces_matrix()
+    assert matrix.shape == (2, 2)
+    assert pd.isna(matrix.loc[0, 0]) and pd.isna(matrix.loc[1, 1])
+    assert matrix.loc[0, 1] == 6 and matrix.loc[1, 0] == 6
+    assert qi.compare_traces_matrix([1, 0], compare_by="value").loc[1, 0] == 3
+
+
+def test_enriched_trace_item_cache():
+    cache_qi = QueryInterface(load_database())
+    enriched = cache_qi.get_enriched_trace_item()
+    assert len(enriched) == len(cache_qi.database.trace_item)
+    assert cache_qi.get_enriched_trace_item() is enriched
+    cache_qi.database.trace_item = cache_qi.database.trace_item.loc[[0]]
+    assert cache_qi.get_enriched_trace_item() is not enriched
+    assert len(cache_qi.compare_instruction_count()) == 1
+
+
+def test_sql_database(tmp_path):
+    sql_database = SqlTraceDatabase(tmp_path / "traces.sqlite")
+    sql_database.write(db)
+    sql_database.close()
+    # reopen to read the stored settings and tables
+    sql_database = SqlTraceDatabase(tmp_path / "traces.sqlite", hash_format="int64")
+    assert sql_database.metadata["hash_format"] == "hex"
+    loaded = sql_database.to_pandas()
+    for table in list(db.tables) + ["op_info"]:
+        pd.testing.assert_frame_equal(getattr(loaded, table), getattr(db, table))
+
+    # content tables keep one row per hash, traces are appended
+    sql_database.write(db)
+    loaded = sql_database.to_pandas()
+    assert len(loaded.trace) == 4
+    assert loaded.instruction.equals(db.instruction)
+    assert loaded.trace_item.loc[2].equals(db.trace_item.loc[0])
+
+
+def test_sql_queries():
+    sql_database = SqlTraceDatabase(":memory:")
+    sql_database.write(db)
+    sql_query = SqlQueryInterface(sql_database)
+    query = QueryInterface(db)
+
+    for selector in [{}, {"type": "LITERAL"}, {"op_code": "/"}, {"cp_type": "x"}]:
+        pd.testing.assert_frame_equal(
+            sql_query.select_operator(**selector),
+            query.select_operator(query.get_enriched_trace_item(), **selector),
+            check_index_type=False,
+        )
+    pd.testing.assert_frame_equal(
+        sql_query.compare_total_operations(), query.compare_total_operations()
+    )
+    pd.testing.assert_frame_equal(
+        sql_query.find_trace_long_operation(min_time_ms=5, top_k=3),
+        query.find_trace_long_operation(min_time_ms=5, top_k=3),
+    )
+    for by in ["trace_id", "op_code", ["trace_id", "op_code"]]:
+        sql_percentiles = sql_query.execution_time_percentiles(by=by)
+        percentiles = query.execution_time_percentiles(by=by)
+        assert sql_percentiles.index.equals(percentiles.index)
+        # interpolated in floating point, can differ by a nanosecond
+        assert ((sql_percentiles - percentiles).abs() <= pd.Timedelta(1)).all(None)
+    # numpy percentiles are no SQL literals by themselves
+    quartiles = sql_query.execution_time_percentiles(percentiles=np.array([0.25, 0.75]))
+    assert quartiles.columns.tolist() == ["p25", "p75"]
+    pandas_quartiles = query.execution_time_percentiles(percentiles=(0.25, 0.75))
+    assert ((quartiles - pandas_quartiles).abs() <= pd.Timedelta(1)).all(None)
+    with pytest.raises(RuntimeError):
+        sql_query.execution_time_percentiles(percentiles=[95])
+    pd.testing.assert_frame_equal(
+        sql_query.compare_instruction_count(type="INSTRUCTION"),
+        query.compare_instruction_count(type="INSTRUCTION"),
+    )
+    pd.testing.assert_frame_equal(
+        sql_query.list_execution_types(), query.list_execution_types(), check_like=True
+    )
+    assert sql_query.compare_traces_by_id(0, 1) == query.compare_traces_by_id(0, 1)
+    assert sql_query.compare_traces_by_id(1, 1) is None
+    dates = db.trace.date.tolist()
+    assert sql_query.compare_traces_by_date(*dates) == query.compare_traces_by_date(
+        *dates
+    )
+
+    value_hash = db.trace_item.value_hash.iloc[-1]
+    for max_depth in [None, 1]:
+        assert (
+            sql_query.ancestors(value_hash, max_depth)
+            .sort_index()
+            .equals(query.ancestors(value_hash, max_depth).sort_index())
+        )
+    value_hash = db.trace_item.value_hash.iloc[0]
+    assert (
+        sql_query.descendants(value_hash)
+        .sort_index()
+        .equals(query.descendants(value_hash).sort_index())
+    )
+
+
+def test_sql_bulk_load(tmp_path):
+    hashes = ["type", "value_hash", "lineage_hash", "dedup_patch_name"]
+    for options in [{}, {"chunk_size": 3}, {"workers": 2, "chunk_size": 3}]:
+        sql_database = SqlTraceDatabase(tmp_path / f"traces{len(options)}.sqlite")
+        assert (
+            load_directory("./src/tests/traces", sql_database=sql_database, **options)
+            is sql_database
+        )
+        loaded = sql_database.to_pandas()
+        assert loaded.trace[["file", "name"]].equals(db.trace[["file", "name"]])
+        assert loaded.trace_item[hashes].equals(db.trace_item[hashes])
+        for table in ["dedup", "creation", "literal", "lineage", "trace_value"]:
+            assert getattr(loaded, table).equals(getattr(db, table))
+        assert loaded.op_info.equals(db.op_info)
+        assert loaded.instruction.op_code.equals(db.instruction.op_code)
+        indexes = sql_database.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        ).fetchall()
+        assert {name for name, in indexes} >= set(sql_database.index_names())
+
+    with pytest.raises(RuntimeError):
+        load_directory("./src/tests/traces", db, sql_database=sql_database)
+
+
+def test_lazy_tables():
+    lazy_db = load_directory("./src/tests/traces")
+    assert set(lazy_db.unconverted) == set(lazy_db.tables)
+    hashes = ["value_hash", "lineage_hash"]
+    assert lazy_db.trace_item[hashes].equals(db.trace_item[hashes])
+    assert "trace_item" not in lazy_db.unconverted
+    assert "instruction" in lazy_db.unconverted
+    assert lazy_db.op_info is db.op_info
+
+    database = LineageTraceDatabase()
+    load_trace("./src/tests/traces/test1.lineage", database)
+    database.to_pandas(lazy=False)
+    assert database.unconverted == {}
+    assert database.literal.equals(db.literal.loc[database.literal.index])
@@ -0,0 +1,98 @@
+import sys
+import json
+import pathlib
+
+sys.path.append("./src")
+
+from TraceLoader import parse_linage_rows, line_ends
+from LineageItemTokenizer import tokenize_record
+from LineageItemGrammar import trace_record
+
+
+def trace_files():
+    return sorted(pathlib.Path("./traces").iterdir()) + sorted(
+        pathlib.Path("./src/tests/traces").iterdir()
+    )
+
+
+def test_tokenizer_parity():
+    for path_to_file in trace_files():
+        fast_rows = parse_linage_rows(path_to_file)
+        grammar_rows = parse_linage_rows(path_to_file, use_tokenizer=False)
+        for fast, grammar in zip(fast_rows, grammar_rows, strict=True):
+            # key order matters, representations are hashed with json.dumps
+            assert json.dumps(fast) == json.dumps(grammar), str(path_to_file)
+
+
+def test_tokenizer_handles_bundled_traces():
+    for path_to_file in trace_files():
+        with open(path_to_file, "r", encoding="utf-8") as lineage_trace_file:
+            for line in lineage_trace_file:
+                assert tokenize_record(line) is not None, repr(line)
+
+
+def test_tokenizer_falls_back():
+    ambiguous_lines = [
+        "(1) (L)  a·SCALAR·STRING·false",
+        "(1) (L) a·SCALAR·STRING·truex",
+        "(2) (C) CP°rand°1·MATRIX·FP64",
+        "(2) (C) CP°rand°1.0E",
+        "(2) (C) CP°createvar°f°g°true°MATRIX°csvx°1",
+        "(2) (C) CP_FILE°rand",
+        "(2) (C) IN#3x",
+        "(3) (I) + (1)(2)",
+        "(3) (I) + (1) (2) [4] x",
+        "patch_x y",
+        "  \n",
+    ]
+    for line in ambiguous_lines:
+        assert tokenize_record(line) is None, repr(line)
+
+
+def test_tokenizer_edge_cases():
+    lines = [
+        "(1) (L) a b ·SCALAR·STRING·false\n",
+        "(2) (C) CP°createvar°f°g°true°MATRIX°binary°1",
+        "(2) (C) CP°rand",
+        "(2) (C) SPARK°seq°1.5e-3°-2.5°-1°normal°·°xxx·MATRIX·FP64",
+        "(3) (D) dedup_X (1)",
+        "patch_X_SB2141_0\n",
+        "\n",
+        "",
+    ]
+    for line in lines:
+        expected = trace_record.parse_string(line).as_dict()
+        assert json.dumps(tokenize_record(line)) == json.dumps(expected)
+
+
+def test_mmap_reader_parity(tmp_path):
+    for path_to_file in trace_files():
+        mmap_rows = parse_linage_rows(path_to_file)
+        text_rows = parse_linage_rows(path_to_file, use_mmap=False)
+        for mapped, text in zip(mmap_rows, text_rows, strict=True):
+            assert json.dumps(mapped) == json.dumps(text), str(path_to_file)
+
+    content = [
+        "(1) (L) 1·SCALAR·INT64·true\r\n",
+        "(2) (I) + (1) (1) [3]\r\n",
+        "\n",
+        "patch_X\n",
+        "(3) (I) * (2) (1)",
+    ]
+    path_to_file = tmp_path / "edge.lineage"
+    path_to_file.write_bytes("".join(content).encode("utf-8"))
+    mmap_rows = list(parse_linage_rows(path_to_file))
+    text_rows = list(parse_linage_rows(path_to_file, use_mmap=False))
+    assert len(mmap_rows) == 5
+    assert json.dumps(mmap_rows) == json.dumps(text_rows)
+
+    empty_file = tmp_path / "empty.lineage"
+    empty_file.write_bytes(b"")
+    assert list(parse_linage_rows(empty_file)) == []
+
+
+def test_line_ends():
+    buffer = b"ab\n\ncd\nefg"
+    assert list(line_ends(buffer)) == [3, 4, 7, 10]
+    assert list(line_ends(buffer, block_size=2)) == [3, 4, 7, 10]
+    assert list(line_ends(b"ab\n", block_size=1)) == [3]
@@ -0,0 +1,56 @@
+import sys
+
+sys.path.append("./src")
+
+from TraceGenerator import TraceGenerator, op_code_frequencies, read_op_codes
+from TraceLoader import load_directory
+from LineageItemGrammar import trace_record
+from LineageItemTokenizer import tokenize_record
+from QueryInterface import QueryInterface
+
+
+def test_generated_lines_parse(tmp_path):
+    generator = TraceGenerator(seed=1)
+    paths = generator.write_traces(tmp_path, 2, 500)
+    assert [path.name for path in paths] == [
+        "synthetic0.lineage",
+        "synthetic1.lineage",
+        "synthetic.lineage.dedup",
+    ]
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as trace_file:
+            for line in trace_file:
+                parsed = trace_record.parse_string(line).as_dict()
+                assert tokenize_record(line) == parsed
+
+
+def test_generated_traces_load(tmp_path):
+    generator = TraceGenerator(
+        item_mix={"L": 0.2, "C": 0.1, "I": 0.6, "D": 0.1},
+        fan_in=(2, 2),
+        op_code_weights={"+": 1, "*": 3},
+        seed=2,
+    )
+    generator.write_traces(tmp_path, 3, 1000, shared_prefix=0.3)
+    db = load_directory(tmp_path)
+    # the .dedup file holds the patches, it is no trace
+    assert len(db.trace) == 3
+    assert len(db.patch_file) == 1
+    assert set(db.instruction.op_code) == {"+", "*"}
+
+    trace_ids = db.trace.index
+    assert (db.trace_item.groupby("trace_id").size() == 1000).all()
+    counts = db.trace_item.type.value_counts(normalize=True)
+    assert 0.5 < counts["INSTRUCTION"] < 0.7
+
+    query = QueryInterface(db)
+    assert query.compare_traces_by_id(trace_ids[0], trace_ids[1]) == 300
+    patch = query.expand_dedup(db.dedup.index[0])
+    assert len(patch) == 20
+    assert patch.bound_value_hash.notna().sum() == 2
+
+
+def test_op_code_frequencies():
+    frequencies = op_code_frequencies(["./src/tests/traces/test1.lineage"])
+    assert frequencies == {"rightIndex": 1 / 3, "-": 1 / 3, "/": 1 / 3}
+    assert set(frequencies) <= set(read_op_codes())